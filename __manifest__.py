@@ -16,6 +16,11 @@
         'data/account_data.xml',
         'data/cron_data.xml',
         'views/settlement_views.xml',
+        'views/retention_views.xml',
+        'views/settlement_preview_views.xml',
+        'views/settlement_run_views.xml',
+        'views/reconciliation_views.xml',
+        'views/external_source_views.xml',
     ],
     'installable': True,
     'auto_install': False,
@@ -1 +1,2 @@
-from . import api_controller
\ No newline at end of file
+from . import api_controller
+from . import export_controller
\ No newline at end of file
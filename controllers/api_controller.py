@@ -1,15 +1,61 @@
-from odoo import http
+from odoo import http, fields
 from odoo.http import request
+from odoo.exceptions import UserError
+from psycopg2 import errors as pg_errors
+from werkzeug.http import quote_etag
+import functools
+import hashlib
 import json
 import logging
+import threading
+
+from ..models.idempotency import idempotency_cache
+from ..models.spatial_index import haversine_km
 
 _logger = logging.getLogger(__name__)
 
+CONCURRENCY_ERRORS = (pg_errors.SerializationFailure, pg_errors.DeadlockDetected, pg_errors.LockNotAvailable)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Nearest restaurant lookups without a radius stop searching at max_radius_km
+DEFAULT_NEARBY_RADIUS_KM = 50
+MAX_NEARBY_RADIUS_KM = 100
+
+SETTLEMENT_API_FIELDS = [
+    'name', 'partner_type', 'week_start', 'week_end', 'settlement_date', 'total_orders', 'total_amount_due',
+    'regular_deliveries', 'high_volume_deliveries', 'total_order_amount', 'total_delivery_fees', 'state',
+]
+
+SETTLEMENT_LINE_API_FIELDS = [
+    'external_order_id', 'order_date', 'amount', 'high_volume_bonus', 'order_amount', 'delivery_fee',
+]
+
+
+def idempotent(route):
+    """Replay the stored response of a route when a request repeats its idempotency key
+
+    The key is read from the Idempotency-Key header or the idempotency_key parameter.
+    Requests without a key are handled as usual.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, **kwargs):
+            key = request.httprequest.headers.get('Idempotency-Key') or kwargs.get('idempotency_key')
+            kwargs.pop('idempotency_key', None)
+            if not key:
+                return method(self, **kwargs)
+            return self._call_idempotent(route, str(key), method, kwargs)
+        return wrapper
+    return decorator
+
 
 class FoodDeliveryAPIController(http.Controller):
 
     @http.route('/api/delivery/calculate_fee', type='json', auth='public',
                 methods=['POST'], csrf=False, cors='*')
+    @idempotent('calculate_fee')
     def calculate_delivery_fee(self, **kwargs):
         """Calculate delivery fee and commission split"""
         try:
@@ -17,8 +63,16 @@ class FoodDeliveryAPIController(http.Controller):
             distance = kwargs.get('distance_km')
             courier_id = kwargs.get('courier_id')
 
+            source = self._get_source(kwargs)
+
+            if not distance and kwargs.get('dropoff_lat') is not None:
+                # Compute the distance server-side from the pickup and drop-off coordinates
+                distance = self._compute_delivery_distance(kwargs, source)
+                if distance is None:
+                    return {'error': 'Unknown pickup location'}
+
             if not distance or not courier_id:
-                return {'error': 'Missing required parameters: distance_km, courier_id'}
+                return {'error': 'Missing required parameters: distance_km or coordinates, courier_id'}
 
             distance = float(distance)
             courier_id = int(courier_id)
@@ -31,7 +85,8 @@ class FoodDeliveryAPIController(http.Controller):
 
             # Find courier by external ID
             courier = request.env['food.delivery.courier'].sudo().search([
-                ('external_courier_id', '=', courier_id)
+                ('external_courier_id', '=', courier_id),
+                ('external_source_id', '=', source.id)
             ], limit=1)
 
             if not courier:
@@ -43,6 +98,7 @@ class FoodDeliveryAPIController(http.Controller):
 
             return {
                 'success': True,
+                'distance_km': distance,
                 'delivery_fee': result.delivery_fee,
                 'company_share': result.company_share,
                 'courier_share': result.courier_share,
@@ -50,15 +106,21 @@ class FoodDeliveryAPIController(http.Controller):
                 'high_volume_bonus': result.high_volume_bonus
             }
 
+        except CONCURRENCY_ERRORS:
+            # Let Odoo retry the whole request on serialization failures
+            raise
         except ValueError as e:
             _logger.error(f"Validation error in calculate_delivery_fee: {e}")
             return {'error': 'Invalid input parameters'}
         except Exception as e:
             _logger.error(f"Error in calculate_delivery_fee: {e}")
             return {'error': 'Internal server error'}
+        finally:
+            self._add_diagnostic_headers()
 
     @http.route('/api/delivery/order_completed', type='json', auth='public',
                 methods=['POST'], csrf=False, cors='*')
+    @idempotent('order_completed')
     def order_completed(self, **kwargs):
         """Record order completion"""
         try:
@@ -83,15 +145,21 @@ class FoodDeliveryAPIController(http.Controller):
 
             return {'success': True, 'message': 'Order marked as delivered'}
 
+        except CONCURRENCY_ERRORS:
+            # Let Odoo retry the whole request on serialization failures
+            raise
         except ValueError as e:
             _logger.error(f"Validation error in order_completed: {e}")
             return {'error': 'Invalid input parameters'}
         except Exception as e:
             _logger.error(f"Error in order_completed: {e}")
             return {'error': 'Internal server error'}
+        finally:
+            self._add_diagnostic_headers()
 
     @http.route('/api/delivery/courier/create', type='json', auth='public',
                 methods=['POST'], csrf=False, cors='*')
+    @idempotent('courier_create')
     def create_courier(self, **kwargs):
         """Create courier record"""
         try:
@@ -104,10 +172,12 @@ class FoodDeliveryAPIController(http.Controller):
                 return {'error': 'Missing required parameters: external_courier_id, name'}
 
             external_courier_id = int(external_courier_id)
+            source = self._get_source(kwargs)
 
-            # Check if courier already exists
+            # Check if courier already exists, external ids are unique within their source
             existing_courier = request.env['food.delivery.courier'].sudo().search([
-                ('external_courier_id', '=', external_courier_id)
+                ('external_courier_id', '=', external_courier_id),
+                ('external_source_id', '=', source.id)
             ], limit=1)
 
             if existing_courier:
@@ -115,13 +185,14 @@ class FoodDeliveryAPIController(http.Controller):
 
             # Create partner for courier
             partner = request.env['res.partner'].sudo().create_courier_partner(
-                external_courier_id, name, phone, email
+                external_courier_id, name, phone, email, external_source_id=source.id or None
             )
 
             # Create courier record
             courier = request.env['food.delivery.courier'].sudo().create({
                 'external_courier_id': external_courier_id,
-                'partner_id': partner.id
+                'partner_id': partner.id,
+                'external_source_id': source.id,
             })
 
             return {
@@ -131,15 +202,21 @@ class FoodDeliveryAPIController(http.Controller):
                 'message': f'Courier {name} created successfully'
             }
 
+        except CONCURRENCY_ERRORS:
+            # Let Odoo retry the whole request on serialization failures
+            raise
         except ValueError as e:
             _logger.error(f"Validation error in create_courier: {e}")
             return {'error': 'Invalid input parameters'}
         except Exception as e:
             _logger.error(f"Error in create_courier: {e}")
             return {'error': 'Internal server error'}
+        finally:
+            self._add_diagnostic_headers()
 
     @http.route('/api/delivery/restaurant/create', type='json', auth='public',
                 methods=['POST'], csrf=False, cors='*')
+    @idempotent('restaurant_create')
     def create_restaurant(self, **kwargs):
         """Create restaurant record"""
         try:
@@ -152,19 +229,17 @@ class FoodDeliveryAPIController(http.Controller):
                 return {'error': 'Missing required parameters: external_restaurant_id, name'}
 
             external_restaurant_id = int(external_restaurant_id)
+            source = self._get_source(kwargs)
 
-            # Check if restaurant already exists
-            existing_restaurant = request.env['res.partner'].sudo().search([
-                ('external_restaurant_id', '=', external_restaurant_id),
-                ('partner_type', '=', 'restaurant')
-            ], limit=1)
+            # Check if restaurant already exists, external ids are unique within their source
+            existing_restaurant = self._find_external_partner('restaurant', external_restaurant_id, source)
 
             if existing_restaurant:
                 return {'error': f'Restaurant {external_restaurant_id} already exists'}
 
             # Create restaurant partner
             partner = request.env['res.partner'].sudo().create_restaurant_partner(
-                external_restaurant_id, name, location_lat, location_lng
+                external_restaurant_id, name, location_lat, location_lng, external_source_id=source.id or None
             )
 
             return {
@@ -173,12 +248,418 @@ class FoodDeliveryAPIController(http.Controller):
                 'message': f'Restaurant {name} created successfully'
             }
 
+        except CONCURRENCY_ERRORS:
+            # Let Odoo retry the whole request on serialization failures
+            raise
         except ValueError as e:
             _logger.error(f"Validation error in create_restaurant: {e}")
             return {'error': 'Invalid input parameters'}
         except Exception as e:
             _logger.error(f"Error in create_restaurant: {e}")
             return {'error': 'Internal server error'}
+        finally:
+            self._add_diagnostic_headers()
+
+    @http.route('/api/delivery/settlements/preview', type='json', auth='user',
+                methods=['POST'], csrf=False, cors='*')
+    def preview_settlements(self, **kwargs):
+        """Preview settlement figures for a date range without creating records"""
+        try:
+            date_from = kwargs.get('date_from')
+            date_to = kwargs.get('date_to')
+
+            if not date_from or not date_to:
+                return {'error': 'Missing required parameters: date_from, date_to'}
+
+            preview = request.env['settlement.automation'].preview_settlements(date_from, date_to)
+
+            return {
+                'success': True,
+                'date_from': str(preview['date_from']),
+                'date_to': str(preview['date_to']),
+                'partners': preview['partners'],
+                'totals': preview['totals'],
+            }
+
+        except (ValueError, UserError) as e:
+            _logger.error(f"Validation error in preview_settlements: {e}")
+            return {'error': 'Invalid input parameters'}
+        except Exception as e:
+            _logger.error(f"Error in preview_settlements: {e}")
+            return {'error': 'Internal server error'}
+
+    @http.route('/api/delivery/partners/<string:partner_type>/<int:external_id>/settlements', type='http',
+                auth='user', methods=['GET'], csrf=False, cors='*')
+    def list_partner_settlements(self, partner_type, external_id, **kwargs):
+        """List settlements of a courier or restaurant, newest week first"""
+        try:
+            limit = min(int(kwargs.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+
+            # Keyset cursor is "<week_start>_<settlement_id>" of the last row of the previous page
+            after = kwargs.get('after')
+            after_week, after_id = None, None
+            if after:
+                after_week, after_id = after.split('_')
+                after_week, after_id = fields.Date.to_date(after_week), int(after_id)
+
+            if limit <= 0:
+                return request.make_json_response({'error': 'Invalid limit'}, status=400)
+
+            partner = self._find_external_partner(partner_type, external_id, self._get_source(kwargs))
+            if not partner or not self._can_access_partner(partner):
+                return request.make_json_response(
+                    {'error': f'{partner_type.capitalize()} {external_id} not found'}, status=404)
+
+            # Fetch keys and versions only, projected fields are read when the page changed
+            keyset = 'AND (s.week_start, s.id) < (%(after_week)s, %(after_id)s)' if after else ''
+            request.env.cr.execute(f"""
+                SELECT s.id, s.week_start, s.write_date, m.write_date
+                FROM food_delivery_settlement s
+                LEFT JOIN account_move m ON m.id = s.vendor_bill_id
+                WHERE s.partner_id = %(partner_id)s
+                AND s.partner_type = %(partner_type)s
+                {keyset}
+                ORDER BY s.week_start DESC, s.id DESC
+                LIMIT %(limit)s
+            """, {
+                'partner_id': partner.id,
+                'partner_type': partner_type,
+                'after_week': after_week,
+                'after_id': after_id,
+                'limit': limit + 1,
+            })
+            keys = request.env.cr.fetchall()
+            has_more = len(keys) > limit
+            keys = keys[:limit]
+
+            etag = self._compute_etag(partner_type, external_id, limit, after, keys)
+            if request.httprequest.if_none_match.contains(etag):
+                return self._not_modified(etag)
+
+            settlements = request.env['food.delivery.settlement'].sudo().browse([key[0] for key in keys])
+            items = settlements.read(SETTLEMENT_API_FIELDS)
+            for item in items:
+                item['week_start'] = str(item['week_start'])
+                item['week_end'] = str(item['week_end'])
+                item['settlement_date'] = str(item['settlement_date'])
+
+            next_cursor = f"{keys[-1][1]}_{keys[-1][0]}" if has_more else None
+            return self._json_response({
+                'success': True,
+                'items': items,
+                'next_cursor': next_cursor,
+            }, etag)
+
+        except ValueError as e:
+            _logger.error(f"Validation error in list_partner_settlements: {e}")
+            return request.make_json_response({'error': 'Invalid input parameters'}, status=400)
+        except Exception as e:
+            _logger.error(f"Error in list_partner_settlements: {e}")
+            return request.make_json_response({'error': 'Internal server error'}, status=500)
+
+    @http.route('/api/delivery/settlements/<int:settlement_id>/lines', type='http', auth='user',
+                methods=['GET'], csrf=False, cors='*')
+    def list_settlement_lines(self, settlement_id, **kwargs):
+        """List lines of a settlement in id order"""
+        try:
+            limit = min(int(kwargs.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+            after_id = int(kwargs.get('after', 0))
+
+            if limit <= 0:
+                return request.make_json_response({'error': 'Invalid limit'}, status=400)
+
+            settlement = request.env['food.delivery.settlement'].sudo().browse(settlement_id)
+            if not settlement.exists() or not self._can_access_partner(settlement.partner_id):
+                return request.make_json_response({'error': f'Settlement {settlement_id} not found'}, status=404)
+
+            # Fetch ids only, lines are never modified after creation and the settlement version covers them
+            request.env.cr.execute("""
+                SELECT id FROM food_delivery_settlement_line
+                WHERE settlement_id = %s AND id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (settlement_id, after_id, limit + 1))
+            line_ids = [row[0] for row in request.env.cr.fetchall()]
+            has_more = len(line_ids) > limit
+            line_ids = line_ids[:limit]
+
+            etag = self._compute_etag(settlement_id, settlement.write_date, limit, after_id, line_ids)
+            if request.httprequest.if_none_match.contains(etag):
+                return self._not_modified(etag)
+
+            lines = request.env['food.delivery.settlement.line'].sudo().browse(line_ids).read(
+                SETTLEMENT_LINE_API_FIELDS)
+            for line in lines:
+                line['order_date'] = str(line['order_date'])
+
+            return self._json_response({
+                'success': True,
+                'items': lines,
+                'next_cursor': str(lines[-1]['id']) if has_more else None,
+            }, etag)
+
+        except ValueError as e:
+            _logger.error(f"Validation error in list_settlement_lines: {e}")
+            return request.make_json_response({'error': 'Invalid input parameters'}, status=400)
+        except Exception as e:
+            _logger.error(f"Error in list_settlement_lines: {e}")
+            return request.make_json_response({'error': 'Internal server error'}, status=500)
+
+    @http.route('/api/delivery/partners/<string:partner_type>/<int:external_id>/earnings', type='http',
+                auth='user', methods=['GET'], csrf=False, cors='*')
+    def partner_earnings(self, partner_type, external_id, **kwargs):
+        """Earnings summary of a courier or restaurant with a monthly breakdown"""
+        try:
+            partner = self._find_external_partner(partner_type, external_id, self._get_source(kwargs))
+            if not partner or not self._can_access_partner(partner):
+                return request.make_json_response(
+                    {'error': f'{partner_type.capitalize()} {external_id} not found'}, status=404)
+
+            params = {'partner_id': partner.id, 'partner_type': partner_type}
+            request.env.cr.execute("""
+                SELECT
+                    COUNT(*),
+                    COALESCE(SUM(s.total_orders), 0),
+                    COALESCE(SUM(s.total_amount_due), 0),
+                    COALESCE(SUM(s.total_amount_due) FILTER (WHERE m.payment_state = 'paid'), 0),
+                    MAX(s.write_date),
+                    MAX(m.write_date)
+                FROM food_delivery_settlement s
+                LEFT JOIN account_move m ON m.id = s.vendor_bill_id
+                WHERE s.partner_id = %(partner_id)s
+                AND s.partner_type = %(partner_type)s
+            """, params)
+            count, total_orders, total_amount, paid_amount, last_write, last_bill_write = request.env.cr.fetchone()
+
+            etag = self._compute_etag(partner_type, external_id, count, last_write, last_bill_write)
+            if request.httprequest.if_none_match.contains(etag):
+                return self._not_modified(etag)
+
+            request.env.cr.execute("""
+                SELECT
+                    DATE_TRUNC('month', s.week_start)::date,
+                    COUNT(*),
+                    COALESCE(SUM(s.total_orders), 0),
+                    COALESCE(SUM(s.total_amount_due), 0)
+                FROM food_delivery_settlement s
+                WHERE s.partner_id = %(partner_id)s
+                AND s.partner_type = %(partner_type)s
+                GROUP BY 1
+                ORDER BY 1 DESC
+            """, params)
+            months = [{
+                'month': str(month),
+                'settlements': month_count,
+                'total_orders': month_orders,
+                'total_amount': month_amount,
+            } for month, month_count, month_orders, month_amount in request.env.cr.fetchall()]
+
+            return self._json_response({
+                'success': True,
+                'total_settlements': count,
+                'total_orders': total_orders,
+                'total_amount': total_amount,
+                'paid_amount': paid_amount,
+                'awaiting_amount': total_amount - paid_amount,
+                'avg_per_order': total_amount / total_orders if total_orders else 0,
+                'months': months,
+            }, etag)
+
+        except ValueError as e:
+            _logger.error(f"Validation error in partner_earnings: {e}")
+            return request.make_json_response({'error': 'Invalid input parameters'}, status=400)
+        except Exception as e:
+            _logger.error(f"Error in partner_earnings: {e}")
+            return request.make_json_response({'error': 'Internal server error'}, status=500)
+
+    @http.route('/api/delivery/restaurants/nearby', type='json', auth='public',
+                methods=['POST'], csrf=False, cors='*')
+    def nearby_restaurants(self, **kwargs):
+        """Restaurants within a radius of a point, or the nearest ones within max_radius_km when no radius is given
+
+        The response reports the searched radius, fewer than limit restaurants means there are no others within it.
+        """
+        try:
+            lat = kwargs.get('lat')
+            lng = kwargs.get('lng')
+
+            if lat is None or lng is None:
+                return {'error': 'Missing required parameters: lat, lng'}
+
+            lat, lng = self._parse_coordinates(lat, lng)
+            limit = min(int(kwargs.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+            radius_km = kwargs.get('radius_km')
+            max_radius_km = float(kwargs.get('max_radius_km', DEFAULT_NEARBY_RADIUS_KM))
+
+            if limit <= 0:
+                return {'error': 'Invalid limit'}
+
+            index = request.env['res.partner'].sudo()._get_spatial_index('restaurant')
+            if radius_km is not None:
+                radius_km = float(radius_km)
+                if radius_km <= 0 or radius_km > MAX_NEARBY_RADIUS_KM:
+                    return {'error': 'Invalid radius value'}
+                matches = index.within(lat, lng, radius_km, limit)
+            else:
+                if max_radius_km <= 0 or max_radius_km > MAX_NEARBY_RADIUS_KM:
+                    return {'error': 'Invalid radius value'}
+                matches = index.nearest(lat, lng, limit, max_radius_km=max_radius_km)
+                radius_km = max_radius_km
+
+            return {
+                'success': True,
+                'radius_km': radius_km,
+                'restaurants': [{
+                    'external_restaurant_id': match['external_id'],
+                    'name': match['name'],
+                    'lat': match['lat'],
+                    'lng': match['lng'],
+                    'distance_km': match['distance_km'],
+                } for match in matches],
+            }
+
+        except ValueError as e:
+            _logger.error(f"Validation error in nearby_restaurants: {e}")
+            return {'error': 'Invalid input parameters'}
+        except Exception as e:
+            _logger.error(f"Error in nearby_restaurants: {e}")
+            return {'error': 'Internal server error'}
+
+    def _parse_coordinates(self, lat, lng):
+        """Validated (lat, lng) floats"""
+        lat, lng = float(lat), float(lng)
+        if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+            raise ValueError(f"Invalid coordinates {lat}, {lng}")
+        return lat, lng
+
+    def _compute_delivery_distance(self, kwargs, source):
+        """Distance in km from a restaurant or pickup point to the drop-off point, None if the pickup is unknown
+
+        The pickup is either given as pickup_lat/pickup_lng or looked up by external restaurant_id of the source.
+        """
+        dropoff = self._parse_coordinates(kwargs.get('dropoff_lat'), kwargs.get('dropoff_lng'))
+        if kwargs.get('pickup_lat') is not None:
+            pickup = self._parse_coordinates(kwargs.get('pickup_lat'), kwargs.get('pickup_lng'))
+        else:
+            restaurant = self._find_external_partner('restaurant', int(kwargs.get('restaurant_id') or 0), source)
+            # Partners without coordinates are stored as (0, 0)
+            if not restaurant or not (restaurant.location_lat or restaurant.location_lng):
+                return None
+            pickup = restaurant.location_lat, restaurant.location_lng
+
+        distance = float(haversine_km(pickup[0], pickup[1], [dropoff[0]], [dropoff[1]])[0])
+        return round(distance, 2)
+
+    def _call_idempotent(self, route, key, method, params):
+        """Run a route once per idempotency key and return the stored response for repeats
+
+        Responses are served from the worker's cache without touching the ORM, or read from the
+        unique-keyed table. The key row is inserted before the route runs, so a concurrent repeat
+        waits on the unique index and is retried by Odoo once the first request has committed.
+        """
+        if len(key) > 255:
+            return {'error': 'Invalid idempotency key'}
+
+        request_hash = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        cache_key = (request.db, route, key)
+        cached = idempotency_cache.get(cache_key)
+        if cached:
+            return self._replay_response(cached, request_hash)
+
+        cr = request.env.cr
+        cr.execute("""
+            INSERT INTO food_delivery_idempotency_key
+                (key, route, request_hash, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (key, route) DO NOTHING
+            RETURNING id
+        """, (key, route, request_hash, request.env.uid, request.env.uid))
+        ttl = request.env['food.delivery.idempotency.key'].sudo()._get_ttl_hours() * 3600
+
+        if not cr.fetchone():
+            cr.execute("""
+                SELECT request_hash, response FROM food_delivery_idempotency_key
+                WHERE key = %s AND route = %s
+            """, (key, route))
+            stored_hash, response = cr.fetchone()
+            stored = (stored_hash, json.loads(response))
+            idempotency_cache.put(cache_key, stored, ttl)
+            return self._replay_response(stored, request_hash)
+
+        # Routes catch their errors, a caught database error leaves the transaction aborted
+        with cr.savepoint() as savepoint:
+            result = method(self, **params)
+            succeeded = isinstance(result, dict) and result.get('success')
+            if not succeeded:
+                savepoint.rollback()
+
+        if succeeded:
+            cr.execute("""
+                UPDATE food_delivery_idempotency_key SET response = %s
+                WHERE key = %s AND route = %s
+            """, (json.dumps(result), key, route))
+            # Only cache responses whose transaction was committed
+            cr.postcommit.add(functools.partial(idempotency_cache.put, cache_key, (request_hash, result), ttl))
+        else:
+            # Failed requests may be retried with the same key
+            cr.execute("DELETE FROM food_delivery_idempotency_key WHERE key = %s AND route = %s", (key, route))
+        return result
+
+    def _replay_response(self, stored, request_hash):
+        """Stored response of a repeated request, unless the key was used with other parameters"""
+        stored_hash, response = stored
+        self._add_diagnostic_headers()
+        if stored_hash != request_hash:
+            return {'error': 'Idempotency key already used with different parameters'}
+        return dict(response, replayed=True)
+
+    def _add_diagnostic_headers(self):
+        """Report the SQL query count of the request when the client sends X-Diagnostics: 1"""
+        if request.httprequest.headers.get('X-Diagnostics') == '1':
+            query_count = getattr(threading.current_thread(), 'query_count', 0)
+            request.future_response.headers['X-Query-Count'] = str(query_count)
+
+    def _get_source(self, kwargs):
+        """External source named by the source parameter, empty for the default external database"""
+        sources = request.env['food.delivery.external.source'].sudo()
+        code = kwargs.get('source')
+        if not code:
+            return sources
+        source = sources.search([('code', '=', code)], limit=1)
+        if not source:
+            raise ValueError(f"Unknown external source {code}")
+        return source
+
+    def _find_external_partner(self, partner_type, external_id, source):
+        """Find the partner of a courier or restaurant by its external id within a source"""
+        if partner_type not in ('courier', 'restaurant'):
+            raise ValueError(f"Invalid partner type {partner_type}")
+
+        return request.env['res.partner'].sudo().search([
+            (f'external_{partner_type}_id', '=', external_id),
+            ('partner_type', '=', partner_type),
+            ('external_source_id', '=', source.id)
+        ], limit=1)
+
+    def _can_access_partner(self, partner):
+        """Internal users see every partner, other users only their own partner"""
+        user = request.env.user
+        return user.has_group('base.group_user') or partner.commercial_partner_id == user.commercial_partner_id
+
+    def _compute_etag(self, *parts):
+        """Build an ETag from the values that identify a response"""
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def _json_response(self, data, etag):
+        """JSON response carrying an ETag"""
+        return request.make_json_response(data, headers=[
+            ('ETag', quote_etag(etag)),
+            ('Cache-Control', 'private, no-cache'),
+        ])
+
+    def _not_modified(self, etag):
+        """Empty 304 response for a matching If-None-Match"""
+        return request.make_response('', status=304, headers=[('ETag', quote_etag(etag))])
 
     @http.route('/api/delivery/health', type='http', auth='public',
                 methods=['GET'], csrf=False, cors='*')
@@ -191,7 +672,8 @@ class FoodDeliveryAPIController(http.Controller):
             return json.dumps({
                 'status': 'healthy',
                 'message': 'Food delivery API is operational',
-                'timestamp': str(request.env.cr.now())
+                'timestamp': str(request.env.cr.now()),
+                'idempotency_cache': idempotency_cache.stats(),
             })
         except Exception as e:
             _logger.error(f"Health check failed: {e}")
@@ -0,0 +1,162 @@
+from odoo import http, fields
+from odoo.http import request, content_disposition
+import csv
+import io
+import json
+import zlib
+import logging
+
+_logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+EXPORT_COLUMNS = [
+    'settlement_id', 'settlement_name', 'partner_id', 'partner_name', 'partner_type',
+    'week_start', 'week_end', 'settlement_date', 'total_orders', 'total_amount_due',
+    'line_id', 'external_order_id', 'order_date', 'amount', 'high_volume_bonus',
+    'order_amount', 'delivery_fee',
+]
+
+
+class SettlementExportController(http.Controller):
+
+    @http.route('/api/delivery/settlements/export', type='http', auth='user',
+                methods=['GET'], csrf=False)
+    def export_settlements(self, **kwargs):
+        """Stream settlements and their lines as CSV or JSONL"""
+        try:
+            date_from = fields.Date.to_date(kwargs.get('date_from'))
+            date_to = fields.Date.to_date(kwargs.get('date_to'))
+            export_format = kwargs.get('format', 'csv')
+            compress = kwargs.get('gzip') in ('1', 'true')
+            partner_type = kwargs.get('partner_type')
+            partner_id = int(kwargs['partner_id']) if kwargs.get('partner_id') else None
+
+            # Resume token is the last "settlement_id:line_id" pair received
+            after = kwargs.get('after')
+            after_settlement, after_line = (int(part) for part in after.split(':')) if after else (0, 0)
+
+            if not date_from or not date_to:
+                return request.make_json_response(
+                    {'error': 'Missing required parameters: date_from, date_to'}, status=400)
+            if export_format not in ('csv', 'jsonl'):
+                return request.make_json_response({'error': 'Invalid format, use csv or jsonl'}, status=400)
+            if partner_type and partner_type not in ('courier', 'restaurant'):
+                return request.make_json_response({'error': 'Invalid partner type'}, status=400)
+
+        except ValueError as e:
+            _logger.error(f"Validation error in export_settlements: {e}")
+            return request.make_json_response({'error': 'Invalid input parameters'}, status=400)
+
+        # Rows are read with raw SQL below, so check model access up front
+        request.env['food.delivery.settlement'].check_access('read')
+        request.env['food.delivery.settlement.line'].check_access('read')
+
+        filters = {
+            'date_from': date_from,
+            'date_to': date_to,
+            'partner_type': partner_type,
+            'partner_id': partner_id,
+        }
+        rows = self._iter_export_rows(request.env.registry, filters, after_settlement, after_line)
+        body = self._encode_jsonl(rows) if export_format == 'jsonl' else self._encode_csv(rows, not after)
+        if compress:
+            body = self._gzip_stream(body)
+
+        filename = f"settlements_{date_from}_{date_to}.{export_format}{'.gz' if compress else ''}"
+        headers = [
+            ('Content-Type', 'application/gzip' if compress else (
+                'text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson')),
+            ('Content-Disposition', content_disposition(filename)),
+            ('Cache-Control', 'no-store'),
+        ]
+        return request.make_response(body, headers=headers)
+
+    def _iter_export_rows(self, registry, filters, after_settlement, after_line):
+        """Yield export rows in (settlement_id, line_id) order, one keyset chunk at a time"""
+        conditions = ['s.week_start >= %(date_from)s', 's.week_end <= %(date_to)s']
+        if filters['partner_type']:
+            conditions.append('s.partner_type = %(partner_type)s')
+        if filters['partner_id']:
+            conditions.append('s.partner_id = %(partner_id)s')
+
+        query = f"""
+            SELECT
+                s.id AS settlement_id,
+                s.name AS settlement_name,
+                s.partner_id,
+                p.name AS partner_name,
+                s.partner_type,
+                s.week_start,
+                s.week_end,
+                s.settlement_date,
+                s.total_orders,
+                s.total_amount_due,
+                COALESCE(l.id, 0) AS line_id,
+                l.external_order_id,
+                l.order_date,
+                l.amount,
+                l.high_volume_bonus,
+                l.order_amount,
+                l.delivery_fee
+            FROM food_delivery_settlement s
+            JOIN res_partner p ON p.id = s.partner_id
+            LEFT JOIN food_delivery_settlement_line l ON l.settlement_id = s.id
+            WHERE {' AND '.join(conditions)}
+            AND s.id >= %(after_settlement)s
+            AND (s.id > %(after_settlement)s OR COALESCE(l.id, 0) > %(after_line)s)
+            ORDER BY s.id, COALESCE(l.id, 0)
+            LIMIT %(limit)s
+        """
+        params = dict(filters, limit=EXPORT_CHUNK_SIZE)
+
+        # The request cursor is closed once the response starts streaming, use a dedicated one
+        with registry.cursor() as cr:
+            while True:
+                params.update(after_settlement=after_settlement, after_line=after_line)
+                cr.execute(query, params)
+                chunk = cr.dictfetchall()
+                yield from chunk
+                if len(chunk) < EXPORT_CHUNK_SIZE:
+                    return
+                after_settlement, after_line = chunk[-1]['settlement_id'], chunk[-1]['line_id']
+
+    def _encode_csv(self, rows, with_header=True):
+        """Encode rows as CSV in chunks of roughly EXPORT_BUFFER_SIZE bytes"""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+        if with_header:
+            writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= EXPORT_BUFFER_SIZE:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    def _encode_jsonl(self, rows):
+        """Encode rows as JSON lines in chunks of roughly EXPORT_BUFFER_SIZE bytes"""
+        lines = []
+        size = 0
+        for row in rows:
+            line = json.dumps(row, default=str) + '\n'
+            lines.append(line)
+            size += len(line)
+            if size >= EXPORT_BUFFER_SIZE:
+                yield ''.join(lines).encode('utf-8')
+                lines = []
+                size = 0
+        if lines:
+            yield ''.join(lines).encode('utf-8')
+
+    def _gzip_stream(self, chunks):
+        """Compress a byte stream incrementally in gzip format"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
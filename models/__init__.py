@@ -1,4 +1,11 @@
+from . import external_source
 from . import courier
 from . import fee_calculation
 from . import settlement
-from . import res_partner
\ No newline at end of file
+from . import res_partner
+from . import retention
+from . import settlement_preview
+from . import settlement_run
+from . import reconciliation
+from . import partner_backfill
+from . import idempotency
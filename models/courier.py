@@ -8,6 +8,8 @@ class FoodDeliveryCourier(models.Model):
     _rec_name = 'display_name'
 
     external_courier_id = fields.Integer('External Courier ID', required=True, index=True)
+    external_source_id = fields.Many2one('food.delivery.external.source', 'External Source', index=True,
+                                         ondelete='restrict')
     partner_id = fields.Many2one('res.partner', 'Courier Contact', required=True)
     display_name = fields.Char('Name', compute='_compute_display_name', store=True)
 
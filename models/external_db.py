@@ -0,0 +1,45 @@
+from contextlib import contextmanager
+from psycopg2.pool import ThreadedConnectionPool
+import threading
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Connection pools to external databases, shared by all threads of the worker
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(connection_params, maxconn=4):
+    """Return the pool for these connection parameters, creating it on first use"""
+    key = tuple(sorted(connection_params.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is not None and not pool.closed:
+            return pool
+
+    # Connecting can last until the connect timeout, threads opening other pools must not wait for it
+    _logger.info(f"Opening external database pool to {connection_params.get('host')}/"
+                 f"{connection_params.get('database')}")
+    new_pool = ThreadedConnectionPool(1, maxconn, **connection_params)
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.closed:
+            _pools[key] = pool = new_pool
+            return pool
+    # Another thread opened the same pool meanwhile
+    new_pool.closeall()
+    return pool
+
+
+@contextmanager
+def pooled_connection(pool):
+    """Borrow a connection from the pool and give it back without an open transaction"""
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        if not conn.closed:
+            conn.rollback()
+        pool.putconn(conn, close=bool(conn.closed))
@@ -0,0 +1,45 @@
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class ExternalSource(models.Model):
+    _name = 'food.delivery.external.source'
+    _description = 'External Mobile App Database'
+    _order = 'sequence, name'
+
+    name = fields.Char('Name', required=True)
+    code = fields.Char('Code', required=True, help='Short unique code of the source, e.g. the city')
+    sequence = fields.Integer('Sequence', default=10)
+    active = fields.Boolean('Active', default=True)
+
+    # Connection settings are restricted like the external.db.* system parameters they replace
+    host = fields.Char('Host', required=True, default='localhost', groups='base.group_system')
+    port = fields.Integer('Port', required=True, default=5432, groups='base.group_system')
+    database = fields.Char('Database', required=True, groups='base.group_system')
+    user = fields.Char('User', required=True, groups='base.group_system')
+    password = fields.Char('Password', groups='base.group_system')
+    pool_size = fields.Integer('Max Connections', default=4, groups='base.group_system')
+    connect_timeout = fields.Integer('Connect Timeout (s)', default=10, groups='base.group_system')
+
+    _sql_constraints = [
+        ('code_uniq', 'unique(code)', 'The code of an external source must be unique.'),
+    ]
+
+    def _get_connection_params(self):
+        """Connection parameters of the source database"""
+        self.ensure_one()
+        return {
+            'host': self.host,
+            'database': self.database,
+            'user': self.user,
+            'password': self.password or '',
+            'port': str(self.port),
+            'connect_timeout': self.connect_timeout or 10,
+        }
+
+    @api.model
+    def _get_active_sources(self):
+        """Registered sources, empty when the single external.db.* database is used"""
+        return self.sudo().search([])
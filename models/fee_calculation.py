@@ -1,4 +1,4 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -15,9 +15,14 @@ class DeliveryFeeCalculation(models.Model):
     company_share = fields.Float('Company Share', digits=(10, 2))
     courier_share = fields.Float('Courier Share', digits=(10, 2))
     courier_id = fields.Many2one('food.delivery.courier', 'Courier', required=True)
-    calculation_date = fields.Datetime('Calculated At', default=fields.Datetime.now)
+    calculation_date = fields.Datetime('Calculated At', default=fields.Datetime.now, index=True)
     high_volume_bonus = fields.Boolean('High Volume Bonus Applied')
 
+    def init(self):
+        # Supports the incremental sync of delivered calculations to the external orders table
+        tools.create_index(self.env.cr, 'food_delivery_fee_calculation_writeback_idx', self._table,
+                           ['write_date', 'id'], where='external_order_id IS NOT NULL')
+
     @api.model
     def calculate_delivery_fee(self, distance_km, courier_id):
         """Calculate delivery fee based on business rules"""
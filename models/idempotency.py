@@ -0,0 +1,89 @@
+from odoo import models, fields, api
+from collections import OrderedDict
+import threading
+import time
+import logging
+
+_logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_CACHE_SIZE = 10000
+
+
+class TTLCache:
+    """Bounded, thread-safe LRU cache whose entries expire after a time to live"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+# Responses of recently replayed or completed requests, per worker process
+idempotency_cache = TTLCache(IDEMPOTENCY_CACHE_SIZE)
+
+
+class IdempotencyKey(models.Model):
+    _name = 'food.delivery.idempotency.key'
+    _description = 'API Idempotency Key'
+    _order = 'create_date desc'
+
+    key = fields.Char('Key', required=True, readonly=True)
+    route = fields.Char('Route', required=True, readonly=True)
+    request_hash = fields.Char('Request Hash', readonly=True)
+    response = fields.Text('Response', readonly=True)
+
+    _sql_constraints = [
+        ('key_route_uniq', 'unique(key, route)', 'An idempotency key can only be used once per route.'),
+    ]
+
+    @api.model
+    def _get_ttl_hours(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('api.idempotency_ttl_hours', 24))
+
+    @api.autovacuum
+    def _gc_expired_keys(self):
+        """Remove keys older than their time to live"""
+        self.env.cr.execute("""
+            DELETE FROM food_delivery_idempotency_key
+            WHERE create_date < (NOW() AT TIME ZONE 'UTC') - %s * INTERVAL '1 hour'
+        """, (self._get_ttl_hours(),))
+        _logger.info(f"Removed {self.env.cr.rowcount} expired idempotency keys, cache: {idempotency_cache.stats()}")
@@ -0,0 +1,144 @@
+from array import array
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EPOCH = datetime(1970, 1, 1)
+
+# Stored for NULL partner ids, orders without a courier or restaurant are left out of its groups
+MISSING_ID = 0
+
+INT_COLUMNS = ('order_id', 'courier_id', 'restaurant_id', 'calculation_id', 'order_count')
+FLOAT_COLUMNS = ('created_at', 'order_total', 'delivery_fee', 'courier_share')
+
+
+class OrderBuffer:
+    """Columnar storage of settlement orders
+
+    Every column is a typed ``array``, so an order costs a few dozen bytes instead of a
+    dict per row. Rows are only materialized as dicts while they are iterated.
+    """
+
+    def __init__(self):
+        self.columns = {name: array('q') for name in INT_COLUMNS}
+        self.columns.update({name: array('d') for name in FLOAT_COLUMNS})
+
+    @classmethod
+    def from_rows(cls, rows):
+        buffer = cls()
+        buffer.extend(rows)
+        return buffer
+
+    def __len__(self):
+        return len(self.columns['order_id'])
+
+    def extend(self, rows):
+        """Append rows of an external query, either single orders or aggregates with an order_count"""
+        columns = self.columns
+        append_order_id = columns['order_id'].append
+        append_courier_id = columns['courier_id'].append
+        append_restaurant_id = columns['restaurant_id'].append
+        append_calculation_id = columns['calculation_id'].append
+        append_order_count = columns['order_count'].append
+        append_created_at = columns['created_at'].append
+        append_order_total = columns['order_total'].append
+        append_delivery_fee = columns['delivery_fee'].append
+        append_courier_share = columns['courier_share'].append
+
+        for row in rows:
+            created_at = row.get('created_at')
+            append_order_id(row.get('order_id') or 0)
+            append_courier_id(row['courier_id'] or MISSING_ID)
+            append_restaurant_id(row['restaurant_id'] or MISSING_ID)
+            append_calculation_id(row.get('calculation_id') or 0)
+            append_order_count(row.get('order_count', 1))
+            append_created_at((created_at - EPOCH).total_seconds() if created_at else 0.0)
+            append_order_total(float(row['order_total'] or 0))
+            append_delivery_fee(float(row['delivery_fee'] or 0))
+            append_courier_share(float(row['courier_share'] or 0))
+
+    def row(self, index):
+        """Materialize one order as a dict shaped like the external query rows"""
+        columns = self.columns
+        created_at = columns['created_at'][index]
+        return {
+            'order_id': columns['order_id'][index],
+            'courier_id': columns['courier_id'][index],
+            'restaurant_id': columns['restaurant_id'][index],
+            'calculation_id': columns['calculation_id'][index],
+            'created_at': EPOCH + timedelta(seconds=created_at) if created_at else None,
+            'order_total': columns['order_total'][index],
+            'delivery_fee': columns['delivery_fee'][index],
+            'courier_share': columns['courier_share'][index],
+        }
+
+    def group(self, key, sum_columns):
+        """Group orders by a key column, orders whose key is missing are skipped
+
+        Returns ``{key: (OrderView, {column: sum})}``, vectorized with NumPy when available.
+        """
+        if not len(self):
+            return {}
+        if np is not None:
+            return self._group_numpy(key, sum_columns)
+        return self._group_python(key, sum_columns)
+
+    def _group_numpy(self, key, sum_columns):
+        key_values = np.frombuffer(self.columns[key], dtype=np.int64)
+        positions = np.flatnonzero(key_values != MISSING_ID)
+        if not len(positions):
+            return {}
+        keys, inverse = np.unique(key_values[positions], return_inverse=True)
+        sums = {
+            column: np.bincount(inverse, weights=np.frombuffer(
+                self.columns[column], dtype=self._dtype(column))[positions], minlength=len(keys))
+            for column in sum_columns
+        }
+        # Order indices grouped by key, in their original order within each group
+        order = positions[np.argsort(inverse, kind='stable')]
+        bounds = np.cumsum(np.bincount(inverse, minlength=len(keys)))[:-1]
+        return {
+            int(group_key): (
+                OrderView(self, indices),
+                {column: float(sums[column][position]) for column in sum_columns},
+            )
+            for position, (group_key, indices) in enumerate(zip(keys, np.split(order, bounds)))
+        }
+
+    def _group_python(self, key, sum_columns):
+        key_column = self.columns[key]
+        value_columns = [(column, self.columns[column]) for column in sum_columns]
+        groups = {}
+        for index, group_key in enumerate(key_column):
+            if group_key == MISSING_ID:
+                continue
+            group = groups.get(group_key)
+            if group is None:
+                group = groups[group_key] = (array('q'), dict.fromkeys(sum_columns, 0.0))
+            group[0].append(index)
+            sums = group[1]
+            for column, values in value_columns:
+                sums[column] += values[index]
+        return {group_key: (OrderView(self, indices), sums) for group_key, (indices, sums) in groups.items()}
+
+    def _dtype(self, column):
+        return np.int64 if column in INT_COLUMNS else np.float64
+
+
+class OrderView:
+    """Orders of one group, a buffer plus the indices of its rows"""
+
+    def __init__(self, buffer, indices):
+        self.buffer = buffer
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        row = self.buffer.row
+        for index in self.indices:
+            yield row(int(index))
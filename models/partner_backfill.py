@@ -0,0 +1,149 @@
+from odoo import models, api
+from psycopg2.extras import RealDictCursor
+import logging
+
+from .external_db import pooled_connection
+
+_logger = logging.getLogger(__name__)
+
+# External tables in backfill order, with the partner type their rows become
+BACKFILL_TABLES = {
+    'couriers': {
+        'partner_type': 'courier',
+        'key': 'courier_id',
+        'query': "SELECT courier_id as external_id, courier_full_name as name, courier_address as street "
+                 "FROM couriers",
+    },
+    'restaurants': {
+        'partner_type': 'restaurant',
+        'key': 'restaurant_id',
+        'query': "SELECT restaurant_id as external_id, restaurant_name as name, restaurant_location as street "
+                 "FROM restaurants",
+    },
+    'customers': {
+        'partner_type': 'customer',
+        'key': 'customer_id',
+        'query': "SELECT customer_id as external_id, customer_full_name as name, customer_address as street "
+                 "FROM customers",
+    },
+}
+
+
+class PartnerBackfill(models.Model):
+    _name = 'food.delivery.partner.backfill'
+    _description = 'Partner Backfill from External Database'
+
+    # Backfills the default external database configured with the external.db.* parameters
+
+    @api.model
+    def _run_backfill(self, tables=None, restart=False, chunk_size=None, auto_commit=True):
+        """Create or update partners of every external courier, restaurant and customer - called by cron
+
+        Tables are read in chunks of the external primary key. The last id of every committed
+        chunk is stored, so an interrupted backfill resumes where it stopped. Use restart to
+        diff whole tables again.
+        """
+        chunk_size = chunk_size or int(self.env['ir.config_parameter'].sudo().get_param('backfill.chunk_size', 5000))
+        pool = self.env['settlement.automation']._get_external_db_pool()
+
+        results = {}
+        with pooled_connection(pool) as conn:
+            for table in tables or BACKFILL_TABLES:
+                results[table] = self._backfill_table(conn, table, chunk_size, restart, auto_commit)
+        return results
+
+    def _backfill_table(self, conn, table, chunk_size, restart, auto_commit):
+        """Backfill one external table chunk by chunk, returns the created and updated counts"""
+        config = self.env['ir.config_parameter'].sudo()
+        source = BACKFILL_TABLES[table]
+        watermark_key = f'backfill.{table}_last_id'
+        last_id = 0 if restart else int(config.get_param(watermark_key, 0))
+
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(f"SELECT COUNT(*) as remaining FROM {table} WHERE {source['key']} > %s", (last_id,))
+        remaining = cursor.fetchone()['remaining']
+        _logger.info(f"Backfilling {remaining} {table} after id {last_id}")
+
+        processed = created = updated = 0
+        while True:
+            cursor.execute(f"{source['query']} WHERE {source['key']} > %s ORDER BY {source['key']} LIMIT %s",
+                           (last_id, chunk_size))
+            rows = cursor.fetchall()
+            # Do not keep a transaction open on the external database while Odoo writes
+            conn.rollback()
+            if not rows:
+                break
+
+            chunk_created, chunk_updated = self._sync_partners(source['partner_type'], rows)
+            created += chunk_created
+            updated += chunk_updated
+            processed += len(rows)
+            last_id = rows[-1]['external_id']
+
+            config.set_param(watermark_key, last_id)
+            if auto_commit:
+                self.env.cr.commit()
+            total = max(remaining, processed)
+            _logger.info(f"Backfilled {processed}/{total} {table} "
+                         f"({processed / total:.1%}): {created} created, {updated} updated")
+
+        return {'processed': processed, 'created': created, 'updated': updated, 'last_id': last_id}
+
+    def _sync_partners(self, partner_type, rows):
+        """Create missing and update changed partners of a chunk, returns the created and updated counts"""
+        partners = self.env['res.partner'].sudo()
+        external_field = f'external_{partner_type}_id'
+        rows_by_id = {row['external_id']: row for row in rows}
+
+        # Diff against existing partners in one query
+        self.env.cr.execute(f"""
+            SELECT {external_field}, id, name, street
+            FROM res_partner
+            WHERE partner_type = %s
+            AND {external_field} = ANY(%s)
+            AND external_source_id IS NULL
+        """, (partner_type, list(rows_by_id)))
+        existing = {external_id: (partner_id, name, street)
+                    for external_id, partner_id, name, street in self.env.cr.fetchall()}
+
+        prepare = getattr(partners, f'_prepare_{partner_type}_partner_vals')
+        new_vals = [dict(prepare(external_id, row['name']), street=row['street'])
+                    for external_id, row in rows_by_id.items() if external_id not in existing]
+        if new_vals:
+            partners.create(new_vals)
+
+        updated = 0
+        for external_id, (partner_id, name, street) in existing.items():
+            row = rows_by_id[external_id]
+            if (name, street) != (row['name'], row['street']):
+                vals = {'name': row['name'], 'street': row['street']}
+                if partner_type == 'restaurant':
+                    vals['restaurant_name'] = row['name']
+                partners.browse(partner_id).write(vals)
+                updated += 1
+
+        if partner_type == 'courier':
+            self._sync_couriers(list(rows_by_id))
+
+        return len(new_vals), updated
+
+    def _sync_couriers(self, external_ids):
+        """Create the courier records missing for courier partners of a chunk"""
+        self.env.cr.execute("""
+            SELECT p.external_courier_id, p.id
+            FROM res_partner p
+            WHERE p.partner_type = 'courier'
+            AND p.external_courier_id = ANY(%s)
+            AND p.external_source_id IS NULL
+            AND NOT EXISTS (
+                SELECT 1 FROM food_delivery_courier c
+                WHERE c.external_courier_id = p.external_courier_id
+                AND c.external_source_id IS NULL
+            )
+        """, (external_ids,))
+        missing = self.env.cr.fetchall()
+        if missing:
+            self.env['food.delivery.courier'].sudo().create([{
+                'external_courier_id': external_courier_id,
+                'partner_id': partner_id,
+            } for external_courier_id, partner_id in missing])
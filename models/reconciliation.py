@@ -0,0 +1,291 @@
+from odoo import models, fields, api
+from odoo.tools import float_compare
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+DISCREPANCY_TYPES = [
+    ('missing_calculation', 'Missing Fee Calculation'),
+    ('duplicate_calculation', 'Duplicate Fee Calculations'),
+    ('calculation_mismatch', 'Calculation ID Mismatch'),
+    ('missing_line', 'Missing Settlement Line'),
+    ('duplicate_line', 'Duplicate Settlement Lines'),
+    ('amount_mismatch', 'Amount Mismatch'),
+    ('not_delivered', 'Order Not Delivered'),
+    ('unknown_order', 'Unknown External Order'),
+]
+
+
+def merge_join(key, *streams):
+    """Merge streams sorted by key, yields (key, rows) with one row or None per stream
+
+    Every stream must be sorted ascending and hold at most one row per key.
+    """
+    iterators = [iter(stream) for stream in streams]
+    heads = [next(iterator, None) for iterator in iterators]
+    while any(head is not None for head in heads):
+        current = min(key(head) for head in heads if head is not None)
+        rows = []
+        for index, head in enumerate(heads):
+            if head is not None and key(head) == current:
+                rows.append(head)
+                heads[index] = next(iterators[index], None)
+            else:
+                rows.append(None)
+        yield current, rows
+
+
+class ReconciliationRun(models.Model):
+    _name = 'food.delivery.reconciliation.run'
+    _description = 'Order Reconciliation Run'
+    _order = 'started_at desc'
+
+    name = fields.Char('Run', compute='_compute_name', store=True)
+    date_from = fields.Date('From', required=True, readonly=True)
+    date_to = fields.Date('To', required=True, readonly=True)
+    started_at = fields.Datetime('Started At', readonly=True, default=fields.Datetime.now)
+    finished_at = fields.Datetime('Finished At', readonly=True)
+    duration = fields.Float('Duration (s)', digits=(12, 3), readonly=True)
+    state = fields.Selection([
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed')
+    ], string='Status', default='running', readonly=True)
+    error_message = fields.Text('Error', readonly=True)
+
+    order_count = fields.Integer('Delivered Orders', readonly=True)
+    calculation_count = fields.Integer('Fee Calculations', readonly=True)
+    line_count = fields.Integer('Settlement Lines', readonly=True)
+    discrepancy_count = fields.Integer('Discrepancies', readonly=True)
+    discrepancy_ids = fields.One2many('food.delivery.reconciliation.discrepancy', 'run_id', 'Discrepancies',
+                                      readonly=True)
+
+    @api.depends('date_from', 'date_to', 'started_at')
+    def _compute_name(self):
+        for record in self:
+            record.name = f"Reconciliation {record.date_from} to {record.date_to} ({record.started_at})"
+
+    def _get_reconciliation_config(self):
+        """Read reconciliation settings from system parameters"""
+        config = self.env['ir.config_parameter'].sudo()
+        return {
+            'lookback_days': int(config.get_param('reconciliation.lookback_days', 31)),
+            'chunk_size': int(config.get_param('reconciliation.chunk_size', 10000)),
+        }
+
+    @api.model
+    def run_reconciliation(self, date_from=None, date_to=None):
+        """Reconcile delivered external orders with fee calculations and settlement lines - called by cron"""
+        settings = self._get_reconciliation_config()
+        date_to = date_to or fields.Date.today() - timedelta(days=1)
+        date_from = date_from or date_to - timedelta(days=settings['lookback_days'] - 1)
+
+        run = self.create({
+            'date_from': date_from,
+            'date_to': date_to,
+        })
+        try:
+            with self.env.cr.savepoint():
+                counts = run._reconcile(settings['chunk_size'])
+            state, error_message = 'done', None
+        except Exception as e:
+            _logger.error(f"Error reconciling orders: {e}")
+            counts, state, error_message = {}, 'failed', str(e)
+
+        finished_at = fields.Datetime.now()
+        run.write({
+            'state': state,
+            'finished_at': finished_at,
+            'duration': (finished_at - run.started_at).total_seconds(),
+            'error_message': error_message,
+            **counts,
+        })
+        _logger.info(f"Reconciliation {date_from} to {date_to} finished: {counts}")
+        return run
+
+    def _reconcile(self, chunk_size):
+        """Merge-join the three order streams and store discrepancies in batches, returns the run counts"""
+        automation = self.env['settlement.automation']
+        bounds = automation._execute_external_query("""
+            SELECT MIN(order_id) as first_order_id, MAX(order_id) as last_order_id
+            FROM orders
+            WHERE order_status = 'delivered'
+            AND DATE(created_at) BETWEEN %s AND %s
+        """, (self.date_from, self.date_to))
+        if not bounds:
+            raise ValueError('Could not read orders from the external database')
+        first_order_id, last_order_id = bounds[0]['first_order_id'], bounds[0]['last_order_id']
+        if first_order_id is None:
+            return {'order_count': 0, 'calculation_count': 0, 'line_count': 0, 'discrepancy_count': 0}
+
+        # Lines are only expected for weeks that were settled already
+        self.env.cr.execute("SELECT MAX(week_end) FROM food_delivery_settlement")
+        settled_until = self.env.cr.fetchone()[0]
+
+        # All orders of the id range, so calculations of undelivered orders are found too
+        external_orders = automation._stream_external_query("""
+            SELECT
+                order_id,
+                order_status,
+                created_at,
+                COALESCE(cost, 0) as order_total,
+                COALESCE(delivery_fee, 0) as delivery_fee,
+                COALESCE(courier_share, 0) as courier_share,
+                COALESCE(company_share, 0) as company_share,
+                odoo_calculation_id
+            FROM orders
+            WHERE order_id BETWEEN %s AND %s
+            ORDER BY order_id
+        """, (first_order_id, last_order_id), itersize=chunk_size)
+        calculations = self._iter_keyset_chunks("""
+            SELECT
+                external_order_id,
+                COUNT(*) as calculation_count,
+                array_agg(id ORDER BY id) as calculation_ids,
+                MIN(delivery_fee) as delivery_fee,
+                MIN(courier_share) as courier_share,
+                MIN(company_share) as company_share
+            FROM food_delivery_fee_calculation
+            WHERE external_order_id > %s AND external_order_id <= %s
+            GROUP BY external_order_id
+            ORDER BY external_order_id
+            LIMIT %s
+        """, first_order_id, last_order_id, chunk_size)
+        lines = self._iter_keyset_chunks("""
+            SELECT
+                l.external_order_id,
+                COUNT(*) FILTER (WHERE s.partner_type = 'courier') as courier_line_count,
+                SUM(l.amount) FILTER (WHERE s.partner_type = 'courier') as courier_amount,
+                COUNT(*) FILTER (WHERE s.partner_type = 'restaurant') as restaurant_line_count,
+                SUM(l.order_amount) FILTER (WHERE s.partner_type = 'restaurant') as order_amount,
+                SUM(l.delivery_fee) FILTER (WHERE s.partner_type = 'restaurant') as delivery_fee
+            FROM food_delivery_settlement_line l
+            JOIN food_delivery_settlement s ON s.id = l.settlement_id
+            WHERE l.external_order_id > %s AND l.external_order_id <= %s
+            GROUP BY l.external_order_id
+            ORDER BY l.external_order_id
+            LIMIT %s
+        """, first_order_id, last_order_id, chunk_size)
+
+        counts = {'order_count': 0, 'calculation_count': 0, 'line_count': 0, 'discrepancy_count': 0}
+        pending = []
+        streams = merge_join(lambda row: row['order_id'], external_orders, calculations, lines)
+        for order_id, (order, calculation, line) in streams:
+            if calculation:
+                counts['calculation_count'] += calculation['calculation_count']
+            if line:
+                counts['line_count'] += line['courier_line_count'] + line['restaurant_line_count']
+            if order and order['order_status'] == 'delivered' and (
+                    self.date_from <= order['created_at'].date() <= self.date_to):
+                counts['order_count'] += 1
+
+            pending.extend(self._check_order(order_id, order, calculation, line, settled_until))
+            if len(pending) >= chunk_size:
+                counts['discrepancy_count'] += self._flush_discrepancies(pending)
+
+        counts['discrepancy_count'] += self._flush_discrepancies(pending)
+        return counts
+
+    def _iter_keyset_chunks(self, query, first_order_id, last_order_id, chunk_size):
+        """Yield rows of an Odoo query keyset-paginated on external_order_id, keyed as order_id"""
+        last_key = first_order_id - 1
+        while True:
+            self.env.cr.execute(query, (last_key, last_order_id, chunk_size))
+            rows = self.env.cr.dictfetchall()
+            for row in rows:
+                row['order_id'] = row['external_order_id']
+                yield row
+            if len(rows) < chunk_size:
+                return
+            last_key = rows[-1]['external_order_id']
+
+    def _check_order(self, order_id, order, calculation, line, settled_until):
+        """Discrepancy values of one order id, given its row on each side"""
+        def discrepancy(discrepancy_type, **values):
+            return {
+                'external_order_id': order_id,
+                'order_date': order and order['created_at'],
+                'discrepancy_type': discrepancy_type,
+                **values,
+            }
+
+        if not order:
+            return [discrepancy('unknown_order', details='No order with this id in the external database')]
+
+        if order['order_status'] != 'delivered':
+            if calculation or line:
+                return [discrepancy('not_delivered', details=f"External order status is {order['order_status']}")]
+            return []
+
+        # Orders at the edges of the id range may fall outside the reconciled dates
+        order_date = order['created_at'].date()
+        if not self.date_from <= order_date <= self.date_to:
+            return []
+
+        result = []
+        if not calculation:
+            result.append(discrepancy('missing_calculation'))
+        elif calculation['calculation_count'] > 1:
+            result.append(discrepancy('duplicate_calculation', odoo_value=calculation['calculation_count'],
+                                      details=f"Calculations {calculation['calculation_ids']}"))
+        else:
+            calculation_id = calculation['calculation_ids'][0]
+            if order['odoo_calculation_id'] and order['odoo_calculation_id'] != calculation_id:
+                result.append(discrepancy('calculation_mismatch', field_name='odoo_calculation_id',
+                                          external_value=order['odoo_calculation_id'], odoo_value=calculation_id))
+            for field_name in ('delivery_fee', 'courier_share', 'company_share'):
+                result.extend(self._check_amount(discrepancy, 'calculation', field_name,
+                                                 order[field_name], calculation[field_name]))
+
+        if settled_until and order_date <= settled_until:
+            for partner_type, checks in (
+                    ('courier', [('courier_amount', 'courier_share')]),
+                    ('restaurant', [('order_amount', 'order_total'), ('delivery_fee', 'delivery_fee')])):
+                line_count = line[f'{partner_type}_line_count'] if line else 0
+                if not line_count:
+                    result.append(discrepancy('missing_line', record_type=partner_type))
+                elif line_count > 1:
+                    result.append(discrepancy('duplicate_line', record_type=partner_type, odoo_value=line_count))
+                else:
+                    for line_field, order_field in checks:
+                        result.extend(self._check_amount(discrepancy, partner_type, line_field,
+                                                         order[order_field], line[line_field]))
+        return result
+
+    def _check_amount(self, discrepancy, record_type, field_name, external_value, odoo_value):
+        external_value, odoo_value = float(external_value or 0), float(odoo_value or 0)
+        if float_compare(external_value, odoo_value, precision_digits=2):
+            return [discrepancy('amount_mismatch', record_type=record_type, field_name=field_name,
+                                external_value=external_value, odoo_value=odoo_value)]
+        return []
+
+    def _flush_discrepancies(self, pending):
+        """Create pending discrepancies in one batch and empty the list"""
+        count = len(pending)
+        if pending:
+            self.env['food.delivery.reconciliation.discrepancy'].create(
+                [dict(values, run_id=self.id) for values in pending])
+            pending.clear()
+        return count
+
+
+class ReconciliationDiscrepancy(models.Model):
+    _name = 'food.delivery.reconciliation.discrepancy'
+    _description = 'Order Reconciliation Discrepancy'
+    _order = 'run_id desc, external_order_id'
+
+    run_id = fields.Many2one('food.delivery.reconciliation.run', 'Run', required=True, index=True,
+                             ondelete='cascade', readonly=True)
+    external_order_id = fields.Integer('Order ID', required=True, index=True, readonly=True)
+    order_date = fields.Datetime('Order Date', readonly=True)
+    discrepancy_type = fields.Selection(DISCREPANCY_TYPES, string='Type', required=True, readonly=True)
+    record_type = fields.Selection([
+        ('calculation', 'Fee Calculation'),
+        ('courier', 'Courier'),
+        ('restaurant', 'Restaurant')
+    ], string='Record', readonly=True)
+    field_name = fields.Char('Field', readonly=True)
+    external_value = fields.Float('External Value', digits=(12, 2), readonly=True)
+    odoo_value = fields.Float('Odoo Value', digits=(12, 2), readonly=True)
+    details = fields.Char('Details', readonly=True)
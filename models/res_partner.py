@@ -1,5 +1,48 @@
 from odoo import models, fields, api
 
+from .spatial_index import GridIndex
+
+# Spatial index of every (database, partner type) with the version it was built from, per worker
+_spatial_indexes = {}
+
+# Fields the spatial indexes are built from
+SPATIAL_FIELDS = {'partner_type', 'location_lat', 'location_lng', 'active', 'name',
+                  'external_restaurant_id', 'external_courier_id'}
+SPATIAL_PARTNER_TYPES = ('restaurant', 'courier')
+
+
+class SpatialIndexVersion(models.Model):
+    _name = 'food.delivery.spatial.index.version'
+    _description = 'Spatial Index Version'
+    _log_access = False
+
+    # One row per partner type, bumped in the transaction that changes an indexed partner
+    partner_type = fields.Selection([
+        ('restaurant', 'Restaurant'),
+        ('courier', 'Courier')
+    ], string='Partner Type', required=True)
+    version = fields.Integer('Version', default=0, required=True)
+
+    _sql_constraints = [
+        ('partner_type_uniq', 'unique(partner_type)', 'There is one spatial index version per partner type.'),
+    ]
+
+    @api.model
+    def _get_version(self, partner_type):
+        self.env.cr.execute("SELECT version FROM food_delivery_spatial_index_version WHERE partner_type = %s",
+                            (partner_type,))
+        row = self.env.cr.fetchone()
+        return row[0] if row else 0
+
+    @api.model
+    def _bump(self, partner_types):
+        for partner_type in sorted(partner_types):
+            self.env.cr.execute("""
+                INSERT INTO food_delivery_spatial_index_version (partner_type, version)
+                VALUES (%s, 1)
+                ON CONFLICT (partner_type) DO UPDATE SET version = food_delivery_spatial_index_version.version + 1
+            """, (partner_type,))
+
 
 class ResPartner(models.Model):
     _inherit = 'res.partner'
@@ -15,6 +58,9 @@ class ResPartner(models.Model):
     external_customer_id = fields.Integer('External Customer ID', index=True)
     external_restaurant_id = fields.Integer('External Restaurant ID', index=True)
     external_courier_id = fields.Integer('External Courier ID', index=True)
+    external_source_id = fields.Many2one('food.delivery.external.source', 'External Source', index=True,
+                                         ondelete='restrict',
+                                         help='Mobile app database the external ids belong to, empty for the default one')
 
     # Location data
     location_lat = fields.Float('Latitude', digits=(10, 6))
@@ -35,47 +81,126 @@ class ResPartner(models.Model):
 
     settlement_ids = fields.One2many('food.delivery.settlement', 'partner_id', 'Settlements')
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        partners = super().create(vals_list)
+        partner_types = {vals.get('partner_type') for vals in vals_list}.intersection(SPATIAL_PARTNER_TYPES)
+        if partner_types:
+            self.env['food.delivery.spatial.index.version']._bump(partner_types)
+        return partners
+
+    def write(self, vals):
+        # Types before the write, a partner may stop being an indexed restaurant or courier
+        partner_types = set()
+        if SPATIAL_FIELDS.intersection(vals):
+            partner_types = set(self.mapped('partner_type')) | {vals.get('partner_type')}
+        result = super().write(vals)
+        partner_types = partner_types.intersection(SPATIAL_PARTNER_TYPES)
+        if partner_types:
+            self.env['food.delivery.spatial.index.version']._bump(partner_types)
+        return result
+
+    def unlink(self):
+        partner_types = set(self.mapped('partner_type')).intersection(SPATIAL_PARTNER_TYPES)
+        result = super().unlink()
+        if partner_types:
+            self.env['food.delivery.spatial.index.version']._bump(partner_types)
+        return result
+
+    def _get_spatial_index(self, partner_type):
+        """Grid index over the locations of restaurants or couriers, cached per worker
+
+        Changes of indexed partners bump the version of their type in the same transaction, a
+        worker rebuilds its index when the version it reads differs from the one it was built at.
+        """
+        if partner_type not in SPATIAL_PARTNER_TYPES:
+            raise ValueError(f"Invalid partner type {partner_type}")
+
+        version = self.env['food.delivery.spatial.index.version']._get_version(partner_type)
+        cache_key = (self.env.cr.dbname, partner_type)
+        cached = _spatial_indexes.get(cache_key)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        self.flush_model(SPATIAL_FIELDS)
+        index = self._build_spatial_index(partner_type)
+        _spatial_indexes[cache_key] = (version, index)
+        return index
+
+    def _build_spatial_index(self, partner_type):
+        """Build the grid index of the located, active partners of a type"""
+        # Partners without coordinates are stored as (0, 0)
+        self.env.cr.execute(f"""
+            SELECT id, external_{partner_type}_id, name, location_lat, location_lng
+            FROM res_partner
+            WHERE partner_type = %s
+            AND active
+            AND location_lat IS NOT NULL
+            AND location_lng IS NOT NULL
+            AND (location_lat != 0 OR location_lng != 0)
+        """, (partner_type,))
+        return GridIndex(self.env.cr.fetchall())
+
     @api.model
-    def create_courier_partner(self, external_courier_id, name, phone=None, email=None):
+    def create_courier_partner(self, external_courier_id, name, phone=None, email=None, external_source_id=None):
         """Create partner for courier"""
-        partner = self.create({
+        partner = self.create(self._prepare_courier_partner_vals(
+            external_courier_id, name, phone, email, external_source_id))
+        return partner
+
+    @api.model
+    def create_restaurant_partner(self, external_restaurant_id, name, location_lat=None, location_lng=None,
+                                  external_source_id=None):
+        """Create partner for restaurant"""
+        partner = self.create(self._prepare_restaurant_partner_vals(
+            external_restaurant_id, name, location_lat, location_lng, external_source_id))
+        return partner
+
+    @api.model
+    def create_customer_partner(self, external_customer_id, name, email=None, phone=None):
+        """Create partner for customer"""
+        partner = self.create(self._prepare_customer_partner_vals(external_customer_id, name, email, phone))
+        return partner
+
+    @api.model
+    def _prepare_courier_partner_vals(self, external_courier_id, name, phone=None, email=None,
+                                      external_source_id=None):
+        return {
             'name': name,
             'phone': phone,
             'email': email,
             'partner_type': 'courier',
             'external_courier_id': external_courier_id,
+            'external_source_id': external_source_id,
             'supplier_rank': 1,  # Set as supplier for vendor bills
             'is_company': True,
-        })
-        return partner
+        }
 
     @api.model
-    def create_restaurant_partner(self, external_restaurant_id, name, location_lat=None, location_lng=None):
-        """Create partner for restaurant"""
-        partner = self.create({
+    def _prepare_restaurant_partner_vals(self, external_restaurant_id, name, location_lat=None, location_lng=None,
+                                         external_source_id=None):
+        return {
             'name': name,
             'restaurant_name': name,
             'partner_type': 'restaurant',
             'external_restaurant_id': external_restaurant_id,
+            'external_source_id': external_source_id,
             'location_lat': location_lat,
             'location_lng': location_lng,
             'supplier_rank': 1,  # Set as supplier for vendor bills
             'is_company': True,
-        })
-        return partner
+        }
 
     @api.model
-    def create_customer_partner(self, external_customer_id, name, email=None, phone=None):
-        """Create partner for customer"""
-        partner = self.create({
+    def _prepare_customer_partner_vals(self, external_customer_id, name, email=None, phone=None):
+        return {
             'name': name,
             'email': email,
             'phone': phone,
             'partner_type': 'customer',
             'external_customer_id': external_customer_id,
             'customer_rank': 1,  # Set as customer
-        })
-        return partner
+        }
 
     def get_settlement_summary(self):
         """Get settlement summary for partner"""
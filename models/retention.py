@@ -0,0 +1,342 @@
+from odoo import models, fields, api
+from datetime import timedelta
+import csv
+import gzip
+import io
+import base64
+import logging
+
+_logger = logging.getLogger(__name__)
+
+FEE_CALCULATION_COLUMNS = [
+    'id', 'external_order_id', 'distance_km', 'delivery_fee', 'company_share', 'courier_share',
+    'courier_id', 'calculation_date', 'high_volume_bonus',
+]
+
+SETTLEMENT_LINE_COLUMNS = [
+    'id', 'settlement_id', 'external_order_id', 'order_date', 'amount', 'high_volume_bonus',
+    'order_amount', 'delivery_fee',
+]
+
+
+class FeeCalculationDaily(models.Model):
+    _name = 'food.delivery.fee.calculation.daily'
+    _description = 'Daily Fee Calculation Summary'
+    _order = 'date desc, courier_id'
+
+    date = fields.Date('Date', required=True, index=True, readonly=True)
+    courier_id = fields.Many2one('food.delivery.courier', 'Courier', required=True, readonly=True,
+                                 ondelete='cascade')
+    quote_count = fields.Integer('Quotes', readonly=True)
+    delivered_count = fields.Integer('Delivered', readonly=True)
+    high_volume_count = fields.Integer('High Volume Quotes', readonly=True)
+    total_distance_km = fields.Float('Total Distance (km)', digits=(12, 2), readonly=True)
+    total_delivery_fee = fields.Float('Total Delivery Fees', digits=(12, 2), readonly=True)
+    total_company_share = fields.Float('Total Company Share', digits=(12, 2), readonly=True)
+    total_courier_share = fields.Float('Total Courier Share', digits=(12, 2), readonly=True)
+
+    _sql_constraints = [
+        ('date_courier_uniq', 'unique(date, courier_id)', 'Only one daily summary per courier and day is allowed.'),
+    ]
+
+
+class FeeCalculationArchive(models.Model):
+    _name = 'food.delivery.fee.calculation.archive'
+    _description = 'Archived Delivery Fee Calculation'
+    _order = 'calculation_date desc'
+
+    original_id = fields.Integer('Original ID', required=True, index=True, readonly=True)
+    external_order_id = fields.Integer('External Order ID', index=True, readonly=True)
+    distance_km = fields.Float('Distance (km)', digits=(8, 2), readonly=True)
+    delivery_fee = fields.Float('Delivery Fee', digits=(10, 2), readonly=True)
+    company_share = fields.Float('Company Share', digits=(10, 2), readonly=True)
+    courier_share = fields.Float('Courier Share', digits=(10, 2), readonly=True)
+    courier_id = fields.Many2one('food.delivery.courier', 'Courier', readonly=True, ondelete='set null')
+    calculation_date = fields.Datetime('Calculated At', readonly=True)
+    high_volume_bonus = fields.Boolean('High Volume Bonus Applied', readonly=True)
+    archived_date = fields.Datetime('Archived At', readonly=True)
+
+
+class SettlementLineArchive(models.Model):
+    _name = 'food.delivery.settlement.line.archive'
+    _description = 'Archived Settlement Line Item'
+
+    original_id = fields.Integer('Original ID', required=True, index=True, readonly=True)
+    settlement_id = fields.Many2one('food.delivery.settlement', 'Settlement', index=True, readonly=True,
+                                    ondelete='cascade')
+    external_order_id = fields.Integer('Order ID', index=True, readonly=True)
+    order_date = fields.Datetime('Order Date', readonly=True)
+    amount = fields.Float('Amount', digits=(10, 2), readonly=True)
+    high_volume_bonus = fields.Boolean('High Volume Bonus Applied', readonly=True)
+    order_amount = fields.Float('Order Amount', digits=(10, 2), readonly=True)
+    delivery_fee = fields.Float('Delivery Fee', digits=(10, 2), readonly=True)
+    archived_date = fields.Datetime('Archived At', readonly=True)
+
+
+class RetentionAutomation(models.Model):
+    _name = 'food.delivery.retention'
+    _description = 'Fee Calculation and Settlement Line Retention'
+
+    def _get_retention_config(self):
+        """Read retention settings from system parameters"""
+        config = self.env['ir.config_parameter'].sudo()
+        return {
+            'quote_purge_days': int(config.get_param('retention.quote_purge_days', 30)),
+            'detail_horizon_days': int(config.get_param('retention.detail_horizon_days', 365)),
+            'rollup_overlap_days': int(config.get_param('retention.rollup_overlap_days', 2)),
+            'batch_size': int(config.get_param('retention.batch_size', 5000)),
+            'archive_mode': config.get_param('retention.archive_mode', 'table'),
+        }
+
+    @api.model
+    def _run_retention(self, auto_commit=True):
+        """Roll up, archive and purge old fee calculations and settlement lines - called by cron"""
+        settings = self._get_retention_config()
+        today = fields.Date.today()
+
+        rolled_up_until = self._rollup_daily_summaries(today, settings['rollup_overlap_days'])
+        if auto_commit:
+            self.env.cr.commit()
+
+        # Never remove detail rows for days that are not rolled up yet
+        quote_cutoff = min(today - timedelta(days=settings['quote_purge_days']), rolled_up_until)
+        detail_cutoff = min(today - timedelta(days=settings['detail_horizon_days']), rolled_up_until)
+
+        purged = self._purge_undelivered_quotes(quote_cutoff, settings['batch_size'], auto_commit)
+
+        if settings['archive_mode'] == 'file':
+            archived_calculations = self._export_fee_calculations(
+                detail_cutoff, settings['batch_size'], auto_commit)
+            archived_lines = self._export_settlement_lines(
+                detail_cutoff, settings['batch_size'], auto_commit)
+        else:
+            archived_calculations = self._archive_fee_calculations(
+                detail_cutoff, settings['batch_size'], auto_commit)
+            archived_lines = self._archive_settlement_lines(
+                detail_cutoff, settings['batch_size'], auto_commit)
+
+        _logger.info(
+            f"Retention finished: rolled up until {rolled_up_until}, purged {purged} undelivered quotes, "
+            f"archived {archived_calculations} fee calculations and {archived_lines} settlement lines "
+            f"({settings['archive_mode']})")
+
+        return {
+            'rolled_up_until': rolled_up_until,
+            'purged_quotes': purged,
+            'archived_calculations': archived_calculations,
+            'archived_lines': archived_lines,
+        }
+
+    def _rollup_daily_summaries(self, today, overlap_days):
+        """Recompute daily summaries for every complete day since the last rollup"""
+        config = self.env['ir.config_parameter'].sudo()
+        watermark = config.get_param('retention.rollup_watermark')
+        last_day = today - timedelta(days=1)
+
+        if watermark:
+            # Re-aggregate a few days back so quotes delivered after midnight are counted
+            first_day = fields.Date.from_string(watermark) - timedelta(days=overlap_days)
+        else:
+            self.env.cr.execute("SELECT MIN(calculation_date)::date FROM food_delivery_fee_calculation")
+            first_day = self.env.cr.fetchone()[0] or today
+
+        if first_day > last_day:
+            return last_day
+
+        self.env.cr.execute("""
+            INSERT INTO food_delivery_fee_calculation_daily (
+                date, courier_id, quote_count, delivered_count, high_volume_count, total_distance_km,
+                total_delivery_fee, total_company_share, total_courier_share,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT
+                c.calculation_date::date,
+                c.courier_id,
+                COUNT(*),
+                COUNT(*) FILTER (WHERE COALESCE(c.external_order_id, 0) <> 0),
+                COUNT(*) FILTER (WHERE c.high_volume_bonus),
+                COALESCE(SUM(c.distance_km), 0),
+                COALESCE(SUM(c.delivery_fee), 0),
+                COALESCE(SUM(c.company_share), 0),
+                COALESCE(SUM(c.courier_share), 0),
+                %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+            FROM food_delivery_fee_calculation c
+            WHERE c.calculation_date >= %(first_day)s
+            AND c.calculation_date < %(end_day)s
+            GROUP BY c.calculation_date::date, c.courier_id
+            ON CONFLICT (date, courier_id) DO UPDATE SET
+                quote_count = EXCLUDED.quote_count,
+                delivered_count = EXCLUDED.delivered_count,
+                high_volume_count = EXCLUDED.high_volume_count,
+                total_distance_km = EXCLUDED.total_distance_km,
+                total_delivery_fee = EXCLUDED.total_delivery_fee,
+                total_company_share = EXCLUDED.total_company_share,
+                total_courier_share = EXCLUDED.total_courier_share,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        """, {
+            'uid': self.env.uid,
+            'first_day': first_day,
+            'end_day': last_day + timedelta(days=1),
+        })
+        _logger.info(f"Rolled up fee calculations from {first_day} to {last_day} ({self.env.cr.rowcount} rows)")
+
+        config.set_param('retention.rollup_watermark', fields.Date.to_string(last_day))
+        self.env['food.delivery.fee.calculation.daily'].invalidate_model()
+        return last_day
+
+    def _run_in_batches(self, query, params, auto_commit):
+        """Execute a batched data-modifying statement until it affects no more rows"""
+        total = 0
+        while True:
+            self.env.cr.execute(query, params)
+            count = self.env.cr.rowcount
+            if auto_commit:
+                self.env.cr.commit()
+            total += count
+            if count < params['batch_size']:
+                return total
+
+    def _purge_undelivered_quotes(self, cutoff, batch_size, auto_commit):
+        """Delete quotes that never got an external order before the cutoff date"""
+        # SKIP LOCKED keeps the purge from waiting on rows the quote API is updating
+        purged = self._run_in_batches("""
+            DELETE FROM food_delivery_fee_calculation
+            WHERE id IN (
+                SELECT id FROM food_delivery_fee_calculation
+                WHERE calculation_date < %(cutoff)s
+                AND COALESCE(external_order_id, 0) = 0
+                ORDER BY id
+                LIMIT %(batch_size)s
+                FOR UPDATE SKIP LOCKED
+            )
+        """, {'cutoff': cutoff, 'batch_size': batch_size}, auto_commit)
+        self.env['food.delivery.fee.calculation'].invalidate_model()
+        return purged
+
+    def _archive_fee_calculations(self, cutoff, batch_size, auto_commit):
+        """Move delivered fee calculations older than the cutoff into the archive table"""
+        archived = self._run_in_batches("""
+            WITH moved AS (
+                DELETE FROM food_delivery_fee_calculation
+                WHERE id IN (
+                    SELECT id FROM food_delivery_fee_calculation
+                    WHERE calculation_date < %(cutoff)s
+                    AND COALESCE(external_order_id, 0) <> 0
+                    ORDER BY id
+                    LIMIT %(batch_size)s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING *
+            )
+            INSERT INTO food_delivery_fee_calculation_archive (
+                original_id, external_order_id, distance_km, delivery_fee, company_share, courier_share,
+                courier_id, calculation_date, high_volume_bonus, archived_date,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT
+                id, external_order_id, distance_km, delivery_fee, company_share, courier_share,
+                courier_id, calculation_date, high_volume_bonus, NOW() AT TIME ZONE 'UTC',
+                %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+            FROM moved
+        """, {'cutoff': cutoff, 'batch_size': batch_size, 'uid': self.env.uid}, auto_commit)
+        self.env['food.delivery.fee.calculation'].invalidate_model()
+        return archived
+
+    def _archive_settlement_lines(self, cutoff, batch_size, auto_commit):
+        """Move lines of settlements that ended before the cutoff into the archive table"""
+        archived = self._run_in_batches("""
+            WITH moved AS (
+                DELETE FROM food_delivery_settlement_line
+                WHERE id IN (
+                    SELECT l.id FROM food_delivery_settlement_line l
+                    JOIN food_delivery_settlement s ON s.id = l.settlement_id
+                    WHERE s.week_end < %(cutoff)s
+                    ORDER BY l.id
+                    LIMIT %(batch_size)s
+                    FOR UPDATE OF l SKIP LOCKED
+                )
+                RETURNING *
+            )
+            INSERT INTO food_delivery_settlement_line_archive (
+                original_id, settlement_id, external_order_id, order_date, amount, high_volume_bonus,
+                order_amount, delivery_fee, archived_date,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT
+                id, settlement_id, external_order_id, order_date, amount, high_volume_bonus,
+                order_amount, delivery_fee, NOW() AT TIME ZONE 'UTC',
+                %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+            FROM moved
+        """, {'cutoff': cutoff, 'batch_size': batch_size, 'uid': self.env.uid}, auto_commit)
+        self.env['food.delivery.settlement.line'].invalidate_model()
+        return archived
+
+    def _export_fee_calculations(self, cutoff, batch_size, auto_commit):
+        """Export delivered fee calculations older than the cutoff to compressed CSV attachments"""
+        archived = self._export_in_batches(
+            'food_delivery_fee_calculation', FEE_CALCULATION_COLUMNS, """
+                DELETE FROM food_delivery_fee_calculation
+                WHERE id IN (
+                    SELECT id FROM food_delivery_fee_calculation
+                    WHERE calculation_date < %(cutoff)s
+                    AND COALESCE(external_order_id, 0) <> 0
+                    ORDER BY id
+                    LIMIT %(batch_size)s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING {columns}
+            """, cutoff, batch_size, auto_commit)
+        self.env['food.delivery.fee.calculation'].invalidate_model()
+        return archived
+
+    def _export_settlement_lines(self, cutoff, batch_size, auto_commit):
+        """Export lines of settlements that ended before the cutoff to compressed CSV attachments"""
+        archived = self._export_in_batches(
+            'food_delivery_settlement_line', SETTLEMENT_LINE_COLUMNS, """
+                DELETE FROM food_delivery_settlement_line
+                WHERE id IN (
+                    SELECT l.id FROM food_delivery_settlement_line l
+                    JOIN food_delivery_settlement s ON s.id = l.settlement_id
+                    WHERE s.week_end < %(cutoff)s
+                    ORDER BY l.id
+                    LIMIT %(batch_size)s
+                    FOR UPDATE OF l SKIP LOCKED
+                )
+                RETURNING {columns}
+            """, cutoff, batch_size, auto_commit)
+        self.env['food.delivery.settlement.line'].invalidate_model()
+        return archived
+
+    def _export_in_batches(self, table, columns, delete_query, cutoff, batch_size, auto_commit):
+        """Delete rows batch by batch and store each batch as a gzip CSV attachment"""
+        query = delete_query.format(columns=', '.join(columns))
+        total = 0
+        while True:
+            self.env.cr.execute(query, {'cutoff': cutoff, 'batch_size': batch_size})
+            rows = self.env.cr.fetchall()
+            if rows:
+                # Attachment is created in the same transaction as the delete
+                self._create_archive_attachment(table, columns, rows)
+            if auto_commit:
+                self.env.cr.commit()
+            total += len(rows)
+            if len(rows) < batch_size:
+                return total
+
+    def _create_archive_attachment(self, table, columns, rows):
+        """Store a batch of archived rows as a gzip compressed CSV attachment"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+        ids = [row[0] for row in rows]
+        name = f"{table}_{min(ids)}-{max(ids)}.csv.gz"
+        return self.env['ir.attachment'].sudo().create({
+            'name': name,
+            'datas': base64.b64encode(gzip.compress(buffer.getvalue().encode('utf-8'))),
+            'mimetype': 'application/gzip',
+            'res_model': self._name,
+            'description': f"Archived {len(rows)} rows from {table}",
+        })
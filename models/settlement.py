@@ -1,10 +1,17 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from odoo.exceptions import UserError
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime, timedelta
 import logging
 
+from .external_db import get_connection_pool, pooled_connection
+from .order_buffer import OrderBuffer
+from .settlement_pipeline import OrderChunkPrefetcher, fetch_from_source, fetch_source_rows, fetch_source_week
+from .settlement_run import SettlementRunRecorder, settlement_span, RECORDER_CONTEXT_KEY
+
 _logger = logging.getLogger(__name__)
 
 
@@ -55,6 +62,14 @@ class Settlement(models.Model):
 
     vendor_bill_count = fields.Integer('Vendor Bill Count', compute='_compute_vendor_bill_count')
 
+    external_source_id = fields.Many2one(related='partner_id.external_source_id', string='External Source',
+                                         store=True, index=True)
+
+    def init(self):
+        # Supports keyset pagination of a partner's settlements by (week_start, id)
+        tools.create_index(self.env.cr, 'food_delivery_settlement_partner_week_idx', self._table,
+                           ['partner_id', 'partner_type', 'week_start', 'id'])
+
     @api.depends('vendor_bill_id')
     def _compute_vendor_bill_count(self):
         for record in self:
@@ -86,7 +101,11 @@ class Settlement(models.Model):
 
         # create vendor bill
         try:
-            vendor_bill = settlement._create_vendor_bill()
+            partner = settlement.partner_id
+            external_id = partner[f'external_{settlement.partner_type}_id']
+            with settlement_span(self.env, 'vendor_bill', settlement.partner_type, external_id, rows=1,
+                                 source_id=partner.external_source_id.id or None):
+                vendor_bill = settlement._create_vendor_bill()
             settlement.write({
                 'vendor_bill_id': vendor_bill.id,
             })
@@ -199,8 +218,9 @@ class SettlementLine(models.Model):
     _name = 'food.delivery.settlement.line'
     _description = 'Settlement Line Item'
 
-    settlement_id = fields.Many2one('food.delivery.settlement', 'Settlement', required=True, ondelete='cascade')
-    external_order_id = fields.Integer('Order ID', required=True)
+    settlement_id = fields.Many2one('food.delivery.settlement', 'Settlement', required=True, ondelete='cascade',
+                                    index=True)
+    external_order_id = fields.Integer('Order ID', required=True, index=True)
     order_date = fields.Datetime('Order Date', required=True)
     amount = fields.Float('Amount', digits=(10, 2), required=True)
 
@@ -216,22 +236,47 @@ class SettlementAutomation(models.Model):
     _name = 'settlement.automation'
     _description = 'Automated Settlement Processing'
 
-    def _get_external_db_connection(self):
-        """Get connection to external PostgreSQL database"""
+    def _get_external_db_params(self):
+        """Connection parameters of the external PostgreSQL database"""
+        config = self.env['ir.config_parameter'].sudo()
+        return {
+            'host': config.get_param('external.db.host', 'localhost'),
+            'database': config.get_param('external.db.name', 'food_delivery'),
+            'user': config.get_param('external.db.user', 'odoo_user'),
+            'password': config.get_param('external.db.password', ''),
+            'port': config.get_param('external.db.port', '5432'),
+        }
+
+    def _get_external_db_connection(self, source=None):
+        """Get connection to external PostgreSQL database, or to a registered external source"""
+        params = source._get_connection_params() if source else self._get_external_db_params()
+        return psycopg2.connect(**params)
+
+    def _get_external_db_pool(self):
+        """Get the connection pool of the external PostgreSQL database, safe to use from threads"""
+        return get_connection_pool(self._get_external_db_params())
+
+    def _get_pipeline_config(self):
+        """Read pipelined settlement settings from system parameters"""
         config = self.env['ir.config_parameter'].sudo()
-        return psycopg2.connect(
-            host=config.get_param('external.db.host', 'localhost'),
-            database=config.get_param('external.db.name', 'food_delivery'),
-            user=config.get_param('external.db.user', 'odoo_user'),
-            password=config.get_param('external.db.password', ''),
-            port=config.get_param('external.db.port', '5432')
-        )
-
-    def _execute_external_query(self, query, params=None):
+        return {
+            'enabled': config.get_param('settlement.pipeline_mode', 'False').lower() in ('1', 'true'),
+            'chunk_size': int(config.get_param('settlement.pipeline_chunk_size', 5000)),
+            'queue_size': int(config.get_param('settlement.pipeline_queue_size', 4)),
+        }
+
+    def _count_external_query(self, count=1):
+        """Count external queries on the settlement run recorder, if one is active"""
+        recorder = self.env.context.get(RECORDER_CONTEXT_KEY)
+        if recorder:
+            recorder.count_external_query(count)
+
+    def _execute_external_query(self, query, params=None, source=None):
         """Execute query on external database"""
         conn = None
+        self._count_external_query()
         try:
-            conn = self._get_external_db_connection()
+            conn = self._get_external_db_connection(source)
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             cursor.execute(query, params or ())
 
@@ -250,35 +295,304 @@ class SettlementAutomation(models.Model):
             if conn:
                 conn.close()
 
+    def _stream_external_query(self, query, params=None, itersize=2000):
+        """Stream rows of a SELECT query through a server-side cursor on the external database"""
+        self._count_external_query()
+        conn = self._get_external_db_connection()
+        try:
+            cursor = conn.cursor(name='food_delivery_stream', cursor_factory=RealDictCursor)
+            cursor.itersize = itersize
+            cursor.execute(query, params or ())
+            yield from cursor
+            cursor.close()
+        finally:
+            conn.close()
+
+    @api.model
+    def sync_calculations_to_external(self, auto_commit=True):
+        """Push calculation ids and shares of delivered orders to the external orders table - called by cron
+
+        Only calculations written since the last sync are read, keyset-paginated on (write_date, id).
+        Every calculation is pushed to the database of its courier's source, order ids of different
+        sources overlap.
+        """
+        config = self.env['ir.config_parameter'].sudo()
+        batch_size = int(config.get_param('settlement.writeback_batch_size', 5000))
+        overlap = timedelta(minutes=int(config.get_param('settlement.writeback_overlap_minutes', 10)))
+        watermark = config.get_param('settlement.writeback_watermark')
+
+        # Re-read a short window before the watermark, transactions committed late may have older write dates
+        last_date = fields.Datetime.from_string(watermark) - overlap if watermark else datetime.min
+        last_id = 0
+        synced = updated = 0
+
+        # Connections are borrowed on first use, per source
+        with ExitStack() as stack:
+            connections = {}
+            while True:
+                self.env.cr.execute("""
+                    SELECT f.id, f.external_order_id, f.delivery_fee, f.courier_share, f.company_share,
+                           f.write_date, c.external_source_id
+                    FROM food_delivery_fee_calculation f
+                    JOIN food_delivery_courier c ON c.id = f.courier_id
+                    WHERE f.external_order_id IS NOT NULL
+                    AND (f.write_date, f.id) > (%s, %s)
+                    ORDER BY f.write_date, f.id
+                    LIMIT %s
+                """, (last_date, last_id, batch_size))
+                batch = self.env.cr.fetchall()
+                if not batch:
+                    break
+
+                source_batches = {}
+                for row in batch:
+                    source_batches.setdefault(row[6], []).append(row)
+                for source_id, source_batch in source_batches.items():
+                    if source_id not in connections:
+                        connections[source_id] = stack.enter_context(
+                            pooled_connection(self._get_source_pool(source_id)))
+                    updated += self._push_calculation_batch(connections[source_id], source_batch)
+                synced += len(batch)
+                last_date, last_id = batch[-1][5], batch[-1][0]
+
+                # The external update is committed first, pushing a batch twice is harmless
+                config.set_param('settlement.writeback_watermark', fields.Datetime.to_string(last_date))
+                if auto_commit:
+                    self.env.cr.commit()
+
+        _logger.info(f"Synced {synced} fee calculations to external orders, {updated} orders updated")
+        return {'synced': synced, 'updated': updated}
+
+    def _get_source_pool(self, source_id):
+        """Connection pool of a registered source, or of the default external database for None"""
+        if not source_id:
+            return self._get_external_db_pool()
+        source = self.env['food.delivery.external.source'].sudo().browse(source_id)
+        return get_connection_pool(source._get_connection_params(), maxconn=source.pool_size or 4)
+
+    def _push_calculation_batch(self, conn, batch):
+        """Update external orders of a batch of calculations in one statement, returns the updated row count"""
+        self._count_external_query()
+        cursor = conn.cursor()
+        execute_values(cursor, """
+            UPDATE orders o
+            SET odoo_calculation_id = v.calculation_id,
+                delivery_fee = v.delivery_fee,
+                courier_share = v.courier_share,
+                company_share = v.company_share,
+                updated_at = NOW()
+            FROM (VALUES %s) AS v(calculation_id, order_id, delivery_fee, courier_share, company_share)
+            WHERE o.order_id = v.order_id
+            AND (o.odoo_calculation_id IS DISTINCT FROM v.calculation_id
+                 OR o.delivery_fee IS DISTINCT FROM v.delivery_fee
+                 OR o.courier_share IS DISTINCT FROM v.courier_share
+                 OR o.company_share IS DISTINCT FROM v.company_share)
+        """, [row[:5] for row in batch],
+            template='(%s::integer, %s::integer, %s::numeric, %s::numeric, %s::numeric)',
+            page_size=len(batch))
+        updated = cursor.rowcount
+        conn.commit()
+        return updated
+
     @api.model
     def generate_weekly_settlements(self):
         """Generate weekly settlements every Monday - unified for both couriers and restaurants"""
+        # Calculate previous week dates
+        today = fields.Date.today()
+        week_start = today - timedelta(days=today.weekday() + 7)  # Previous Monday
+        week_end = week_start + timedelta(days=6)  # Previous Sunday
+
+        # Settle against calculation ids and shares that are known to the external database
         try:
-            # Calculate previous week dates
-            today = fields.Date.today()
-            week_start = today - timedelta(days=today.weekday() + 7)  # Previous Monday
-            week_end = week_start + timedelta(days=6)  # Previous Sunday
+            with self.env.cr.savepoint():
+                self.sync_calculations_to_external(auto_commit=False)
+        except psycopg2.Error as e:
+            _logger.error(f"Could not sync fee calculations before settlement: {e}")
+
+        # Every run is recorded with its phase timings
+        run = self.env['food.delivery.settlement.run'].create({
+            'week_start': week_start,
+            'week_end': week_end,
+        })
+        recorder = SettlementRunRecorder(self.env.cr)
+        profiler = run._start_profiler()
+
+        order_count, settlements, error_message = 0, [], None
+        try:
+            with self.env.cr.savepoint():
+                order_count, settlements = self.with_context(
+                    **{RECORDER_CONTEXT_KEY: recorder})._generate_settlements(week_start, week_end)
+        except Exception as e:
+            _logger.error(f"Error generating settlements: {e}")
+            error_message = str(e)
+        finally:
+            if profiler:
+                run._stop_profiler(profiler)
 
-            _logger.info(f"Generating unified settlements for week {week_start} to {week_end}")
+        run._record(recorder, 'failed' if error_message else 'done', order_count, len(settlements), error_message)
 
-            # Get delivered orders from external database (single query)
+    def _generate_settlements(self, week_start, week_end):
+        """Fetch, group and settle delivered orders of a week, returns the order count and settlements"""
+        _logger.info(f"Generating unified settlements for week {week_start} to {week_end}")
+
+        pipeline = self._get_pipeline_config()
+        sources = self.env['food.delivery.external.source']._get_active_sources()
+        if sources:
+            if pipeline['enabled']:
+                _logger.info("Pipeline mode only applies to the default external database, "
+                             f"fetching {len(sources)} registered sources concurrently instead")
+            return self._generate_settlements_multi_source(sources, week_start, week_end)
+
+        if pipeline['enabled']:
+            return self._generate_settlements_pipelined(
+                week_start, week_end, pipeline['chunk_size'], pipeline['queue_size'])
+
+        # Get delivered orders from external database (single query)
+        with settlement_span(self.env, 'fetch') as span:
             delivered_orders = self._get_weekly_orders(week_start, week_end)
+            span['rows'] = len(delivered_orders)
 
-            if not delivered_orders:
-                _logger.info("No delivered orders found for settlement period")
-                return
+        if not delivered_orders:
+            _logger.info("No delivered orders found for settlement period")
+            return 0, []
 
-            # Process both courier and restaurant settlements from same data
-            settlements = self._process_unified_settlements(delivered_orders, week_start, week_end)
+        # Process both courier and restaurant settlements from same data
+        settlements = self._process_unified_settlements(delivered_orders, week_start, week_end)
 
-            _logger.info(f"Generated {len(settlements)} unified settlements with auto-created vendor bills")
+        _logger.info(f"Generated {len(settlements)} unified settlements with auto-created vendor bills")
+        return len(delivered_orders), settlements
 
-        except Exception as e:
-            _logger.error(f"Error generating settlements: {e}")
+    def _generate_settlements_pipelined(self, week_start, week_end, chunk_size, queue_size):
+        """Settle a week chunk by chunk while background threads prefetch the next chunks
+
+        Couriers and restaurants are settled in two passes over orders sorted by the
+        partner, each pass fed by its own prefetch thread and pooled connection.
+        """
+        pool = self._get_external_db_pool()
+        prefetchers = {}
+        for partner_type in ('courier', 'restaurant'):
+            partner_key = f'{partner_type}_id'
+            prefetchers[partner_type] = OrderChunkPrefetcher(
+                pool, self._get_weekly_orders_query(order_by=f'o.{partner_key}, o.order_id'),
+                (week_start, week_end), partner_key, chunk_size, queue_size)
+
+        settlements = []
+        order_count = 0
+        try:
+            for prefetcher in prefetchers.values():
+                self._count_external_query()
+                prefetcher.start()
+
+            for chunk in self._iter_prefetched_chunks(prefetchers['courier']):
+                order_count += len(chunk)
+                with settlement_span(self.env, 'group', rows=len(chunk)):
+                    courier_data, _restaurant_data = self._group_orders(chunk)
+                settlements.extend(self._create_courier_settlements(courier_data, week_start, week_end))
+
+            for chunk in self._iter_prefetched_chunks(prefetchers['restaurant']):
+                with settlement_span(self.env, 'group', rows=len(chunk)):
+                    _courier_data, restaurant_data = self._group_orders(chunk)
+                settlements.extend(self._create_restaurant_settlements(restaurant_data, week_start, week_end))
+
+        finally:
+            for prefetcher in prefetchers.values():
+                prefetcher.stop()
+
+        if not order_count:
+            _logger.info("No delivered orders found for settlement period")
+
+        _logger.info(f"Generated {len(settlements)} unified settlements with pipelined fetch")
+        return order_count, settlements
+
+    def _generate_settlements_multi_source(self, sources, week_start, week_end):
+        """Fetch the week of every registered source concurrently, then settle each source
+
+        Every source is read by its own thread and pooled connection, together with the details
+        of the couriers and restaurants of its orders, so the fetch takes as long as the slowest
+        source. External ids of partners are only unique within their source.
+        """
+        with settlement_span(self.env, 'fetch') as span:
+            # Orders, courier details and restaurant details
+            self._count_external_query(3 * len(sources))
+            results = self._fetch_sources(
+                sources, fetch_source_week, self._get_weekly_orders_query(), (week_start, week_end),
+                self._get_courier_details_query(), self._get_restaurant_details_query())
+            span['rows'] = sum(len(orders) for orders, _couriers, _restaurants in results.values())
+
+        settlements = []
+        order_count = 0
+        for source, (orders, courier_details, restaurant_details) in results.items():
+            _logger.info(f"Settling {len(orders)} delivered orders of source {source.code}")
+            if not orders:
+                continue
+            order_count += len(orders)
+            settlements.extend(self._process_unified_settlements(
+                orders, week_start, week_end, source, courier_details, restaurant_details))
+
+        if not order_count:
+            _logger.info("No delivered orders found for settlement period")
+
+        _logger.info(f"Generated {len(settlements)} unified settlements across {len(sources)} sources")
+        return order_count, settlements
+
+    def _fetch_sources(self, sources, fetch, *args):
+        """Run fetch(pool, *args) on every source concurrently, returns the results by source
+
+        A week is settled for all sources or none: runs do not skip partners settled already, so a
+        run missing a city could not be repeated later without duplicating the settlements of the
+        others. Every source is still waited for, and the error names all sources that failed.
+        """
+        max_workers = int(self.env['ir.config_parameter'].sudo().get_param('settlement.source_workers', 8))
+
+        # Pools are opened in the threads, connecting to an unreachable source only blocks its own thread
+        results, failures = {}, []
+        with ThreadPoolExecutor(max_workers=max(1, min(len(sources), max_workers)),
+                                thread_name_prefix='settlement-source') as executor:
+            futures = {source: executor.submit(
+                fetch_from_source, source._get_connection_params(), source.pool_size or 4, fetch, *args,
+            ) for source in sources}
+
+            for source, future in futures.items():
+                try:
+                    results[source] = future.result()
+                except psycopg2.Error as e:
+                    _logger.error(f"Fetching from source {source.code} failed: {e}")
+                    failures.append(source.name)
+
+        if failures:
+            raise UserError(f"Fetching from external sources {', '.join(failures)} failed, "
+                            "no source was settled")
+        return results
+
+    def _iter_prefetched_chunks(self, prefetcher):
+        """Yield order chunks of a prefetcher, the time spent waiting is recorded as fetch"""
+        while True:
+            with settlement_span(self.env, 'fetch') as span:
+                chunk = prefetcher.queue.get()
+                if isinstance(chunk, list):
+                    span['rows'] = len(chunk)
+
+            if chunk is prefetcher.DONE:
+                return
+            if isinstance(chunk, BaseException):
+                raise UserError(f'Fetching orders from the external database failed: {chunk}')
+            yield chunk
 
     def _get_weekly_orders(self, week_start, week_end):
-        """Get delivered orders for settlement calculation - single query for both couriers and restaurants"""
-        query = """
+        """Get delivered orders for settlement calculation - single query for both couriers and restaurants
+
+        Rows are streamed from a server-side cursor straight into a columnar OrderBuffer.
+        """
+        try:
+            return OrderBuffer.from_rows(
+                self._stream_external_query(self._get_weekly_orders_query(), (week_start, week_end)))
+        except psycopg2.Error as e:
+            _logger.error(f"Database query error: {e}")
+            return OrderBuffer()
+
+    def _get_weekly_orders_query(self, order_by='o.created_at'):
+        """Query of delivered orders in a date range"""
+        return f"""
         SELECT 
             o.order_id,
             o.courier_id,
@@ -292,122 +606,316 @@ class SettlementAutomation(models.Model):
         FROM orders o
         WHERE o.order_status = 'delivered'
         AND DATE(o.created_at) BETWEEN %s AND %s
-        ORDER BY o.created_at
+        ORDER BY {order_by}
+        """
+
+    def _get_weekly_order_totals(self, date_from, date_to):
+        """Stream delivered order totals pre-aggregated per courier and restaurant pair"""
+        return self._stream_external_query(self._get_weekly_order_totals_query(), (date_from, date_to))
+
+    def _get_weekly_order_totals_query(self):
+        """Query of delivered order totals per courier and restaurant pair in a date range"""
+        return """
+        SELECT
+            o.courier_id,
+            o.restaurant_id,
+            COUNT(*) as order_count,
+            SUM(COALESCE(o.cost, 0)) as order_total,
+            SUM(COALESCE(o.delivery_fee, 0)) as delivery_fee,
+            SUM(COALESCE(o.courier_share, 0)) as courier_share,
+            SUM(COALESCE(o.company_share, 0)) as company_share,
+            ARRAY_AGG(o.odoo_calculation_id) FILTER (WHERE o.odoo_calculation_id IS NOT NULL) as calculation_ids
+        FROM orders o
+        WHERE o.order_status = 'delivered'
+        AND DATE(o.created_at) BETWEEN %s AND %s
+        GROUP BY o.courier_id, o.restaurant_id
+        ORDER BY o.courier_id, o.restaurant_id
+        """
+
+    def _get_preview_watermark(self, date_from, date_to, sources=None):
+        """Return a value that changes whenever data feeding a settlement preview changes"""
+        query = """
+        SELECT
+            COUNT(*) as order_count,
+            MAX(o.order_id) as last_order_id,
+            MAX(o.updated_at) as last_update
+        FROM orders o
+        WHERE DATE(o.created_at) BETWEEN %s AND %s
+        """
+        if sources:
+            self._count_external_query(len(sources))
+            results = self._fetch_sources(sources, fetch_source_rows, query, (date_from, date_to))
+            external = [(source.id, results[source][0]) for source in sources]
+        else:
+            result = self._execute_external_query(query, (date_from, date_to))
+            external = [(None, result[0] if result else {})]
+
+        self.env.cr.execute("SELECT MAX(write_date) FROM food_delivery_fee_calculation")
+        calculations_updated = self.env.cr.fetchone()[0]
+
+        return tuple(
+            (source_id, row.get('order_count'), row.get('last_order_id'), str(row.get('last_update')))
+            for source_id, row in external
+        ) + (str(calculations_updated),)
+
+    @api.model
+    def preview_settlements(self, date_from, date_to):
+        """Compute settlement figures for any date range without creating any records"""
+        date_from = fields.Date.to_date(date_from)
+        date_to = fields.Date.to_date(date_to)
+        if not date_from or not date_to or date_from > date_to:
+            raise UserError('A valid date range is required for the settlement preview')
+
+        sources = self.env['food.delivery.external.source']._get_active_sources()
+        watermark = self._get_preview_watermark(date_from, date_to, sources)
+        preview = self._compute_settlement_preview(date_from, date_to, watermark)
+
+        # The cached value is shared, hand out copies
+        return {
+            'date_from': date_from,
+            'date_to': date_to,
+            'partners': [dict(partner) for partner in preview['partners']],
+            'totals': dict(preview['totals']),
+        }
+
+    @tools.ormcache('date_from', 'date_to', 'watermark')
+    def _compute_settlement_preview(self, date_from, date_to, watermark):
+        """Group streamed order totals like the weekly settlement run, cached per (range, watermark)
+
+        Like the run, registered sources are read concurrently and replace the default database.
         """
+        sources = self.env['food.delivery.external.source']._get_active_sources()
+        partners = []
+        if sources:
+            self._count_external_query(len(sources))
+            results = self._fetch_sources(
+                sources, fetch_source_rows, self._get_weekly_order_totals_query(), (date_from, date_to))
+            for source in sources:
+                partners.extend(self._preview_partners(results[source], source))
+        else:
+            partners.extend(self._preview_partners(self._get_weekly_order_totals(date_from, date_to)))
+
+        couriers = [p for p in partners if p['partner_type'] == 'courier']
+        restaurants = [p for p in partners if p['partner_type'] == 'restaurant']
+        totals = {
+            'courier_count': len(couriers),
+            'restaurant_count': len(restaurants),
+            'total_orders': sum(p['total_orders'] for p in restaurants),
+            'courier_amount_due': sum(p['total_amount_due'] for p in couriers),
+            'restaurant_amount_due': sum(p['total_amount_due'] for p in restaurants),
+        }
+
+        return {'partners': tuple(partners), 'totals': totals}
+
+    def _preview_partners(self, rows, source=None):
+        """Preview figures of every courier and restaurant in the order totals of one source"""
+        courier_calculations = {}
+
+        def collect_calculation_ids(rows):
+            for row in rows:
+                courier_calculations.setdefault(row['courier_id'], []).extend(row['calculation_ids'] or [])
+                yield row
 
-        return self._execute_external_query(query, (week_start, week_end))
+        try:
+            courier_data, restaurant_data = self._group_orders(collect_calculation_ids(rows), keep_orders=False)
+        except psycopg2.Error as e:
+            _logger.error(f"Settlement preview query failed: {e}")
+            raise UserError('Could not read orders from the external database')
+
+        # Resolve high volume bonus flags with a single query
+        all_calculation_ids = [calc_id for ids in courier_calculations.values() for calc_id in ids]
+        high_volume_ids = set()
+        if all_calculation_ids:
+            self.env.cr.execute("""
+                SELECT id FROM food_delivery_fee_calculation
+                WHERE id = ANY(%s) AND high_volume_bonus
+            """, (all_calculation_ids,))
+            high_volume_ids = {row[0] for row in self.env.cr.fetchall()}
+
+        # Resolve existing partners only, nothing is created during a preview
+        source_id = source.id if source else False
+        couriers = self.env['food.delivery.courier'].search_read([
+            ('external_courier_id', 'in', list(courier_data)),
+            ('external_source_id', '=', source_id)
+        ], ['external_courier_id', 'partner_id'])
+        courier_partners = {c['external_courier_id']: c['partner_id'] for c in couriers}
+        restaurants = self.env['res.partner'].search_read([
+            ('external_restaurant_id', 'in', list(restaurant_data)),
+            ('partner_type', '=', 'restaurant'),
+            ('external_source_id', '=', source_id)
+        ], ['external_restaurant_id', 'display_name'])
+        restaurant_partners = {r['external_restaurant_id']: (r['id'], r['display_name']) for r in restaurants}
+
+        # External ids are only unique within a source
+        suffix = f" ({source.code})" if source else ''
+        partners = []
+        for external_courier_id, data in courier_data.items():
+            high_volume_count = sum(
+                1 for calc_id in courier_calculations.get(external_courier_id, []) if calc_id in high_volume_ids)
+            partner = courier_partners.get(external_courier_id) or (
+                False, f"Courier #{external_courier_id}{suffix}")
+            partners.append({
+                'partner_type': 'courier',
+                'source': source.code if source else None,
+                'external_id': external_courier_id,
+                'partner_id': partner[0],
+                'partner_name': partner[1],
+                'total_orders': data['total_deliveries'],
+                'total_amount_due': data['total_amount'],
+                'regular_deliveries': data['total_deliveries'] - high_volume_count,
+                'high_volume_deliveries': high_volume_count,
+                'total_order_amount': 0.0,
+                'total_delivery_fees': 0.0,
+            })
+
+        for external_restaurant_id, data in restaurant_data.items():
+            partner = restaurant_partners.get(external_restaurant_id) or (
+                False, f"Restaurant #{external_restaurant_id}{suffix}")
+            partners.append({
+                'partner_type': 'restaurant',
+                'source': source.code if source else None,
+                'external_id': external_restaurant_id,
+                'partner_id': partner[0],
+                'partner_name': partner[1],
+                'total_orders': data['total_orders'],
+                'total_amount_due': data['total_order_amount'] - data['total_delivery_fees'],
+                'regular_deliveries': 0,
+                'high_volume_deliveries': 0,
+                'total_order_amount': data['total_order_amount'],
+                'total_delivery_fees': data['total_delivery_fees'],
+            })
 
-    def _process_unified_settlements(self, orders, week_start, week_end):
+        return partners
+
+    def _process_unified_settlements(self, orders, week_start, week_end, source=None,
+                                     courier_details=None, restaurant_details=None):
         """Process both courier and restaurant settlements from unified order data"""
         settlements = []
 
         # Group orders by courier and restaurant
-        courier_data = {}
-        restaurant_data = {}
-
-        for order in orders:
-            # Group by courier
-            courier_id = order['courier_id']
-            if courier_id not in courier_data:
-                courier_data[courier_id] = {
-                    'total_amount': 0,
-                    'total_deliveries': 0,
-                    'regular_deliveries': 0,
-                    'high_volume_deliveries': 0,
-                    'orders': []
-                }
-
-            courier_data[courier_id]['total_amount'] += float(order['courier_share'] or 0)
-            courier_data[courier_id]['total_deliveries'] += 1
-            courier_data[courier_id]['orders'].append(order)
-
-            # Group by restaurant
-            restaurant_id = order['restaurant_id']
-            if restaurant_id not in restaurant_data:
-                restaurant_data[restaurant_id] = {
-                    'total_order_amount': 0,
-                    'total_delivery_fees': 0,
-                    'total_orders': 0,
-                    'orders': []
-                }
-
-            restaurant_data[restaurant_id]['total_order_amount'] += float(order['order_total'] or 0)
-            restaurant_data[restaurant_id]['total_delivery_fees'] += float(order['delivery_fee'] or 0)
-            restaurant_data[restaurant_id]['total_orders'] += 1
-            restaurant_data[restaurant_id]['orders'].append(order)
+        with settlement_span(self.env, 'group', rows=len(orders)):
+            courier_data, restaurant_data = self._group_orders(orders)
 
         # Create courier settlements
-        settlements.extend(self._create_courier_settlements(courier_data, week_start, week_end))
+        settlements.extend(self._create_courier_settlements(
+            courier_data, week_start, week_end, source, courier_details))
 
         # Create restaurant settlements
-        settlements.extend(self._create_restaurant_settlements(restaurant_data, week_start, week_end))
+        settlements.extend(self._create_restaurant_settlements(
+            restaurant_data, week_start, week_end, source, restaurant_details))
 
         return settlements
 
-    def _create_courier_settlements(self, courier_data, week_start, week_end):
+    def _group_orders(self, orders, keep_orders=True):
+        """Group order rows by courier and restaurant
+
+        Rows are either single orders or pre-aggregated rows carrying an ``order_count``.
+        They are packed into a columnar OrderBuffer, and ``orders`` of each group is a
+        view over that buffer.
+        """
+        buffer = orders if isinstance(orders, OrderBuffer) else OrderBuffer.from_rows(orders)
+        no_orders = ()
+
+        courier_data = {}
+        for courier_id, (courier_orders, sums) in buffer.group(
+                'courier_id', ('courier_share', 'order_count')).items():
+            courier_data[courier_id] = {
+                'total_amount': sums['courier_share'],
+                'total_deliveries': int(sums['order_count']),
+                'regular_deliveries': 0,
+                'high_volume_deliveries': 0,
+                'orders': courier_orders if keep_orders else no_orders
+            }
+
+        restaurant_data = {}
+        for restaurant_id, (restaurant_orders, sums) in buffer.group(
+                'restaurant_id', ('order_total', 'delivery_fee', 'order_count')).items():
+            restaurant_data[restaurant_id] = {
+                'total_order_amount': sums['order_total'],
+                'total_delivery_fees': sums['delivery_fee'],
+                'total_orders': int(sums['order_count']),
+                'orders': restaurant_orders if keep_orders else no_orders
+            }
+
+        return courier_data, restaurant_data
+
+    def _create_courier_settlements(self, courier_data, week_start, week_end, source=None, courier_details=None):
         """Create courier settlements"""
         settlements = []
+        source_id = source.id if source else None
 
         for external_courier_id, data in courier_data.items():
             # Find or create courier in Odoo
-            courier = self._find_or_create_courier(external_courier_id)
+            with settlement_span(self.env, 'partner_resolution', 'courier', external_courier_id, rows=1,
+                                 source_id=source_id):
+                courier = self._find_or_create_courier(
+                    external_courier_id, source, (courier_details or {}).get(external_courier_id))
             if not courier:
                 continue
 
-            # Calculate high volume vs regular deliveries
-            regular_count = 0
-            high_volume_count = 0
-
-            for order in data['orders']:
-                if order.get('calculation_id'):
-                    calc = self.env['food.delivery.fee.calculation'].browse(order['calculation_id'])
-                    if calc.exists() and calc.high_volume_bonus:
-                        high_volume_count += 1
+            with settlement_span(self.env, 'settlement_create', 'courier', external_courier_id, rows=1,
+                                 source_id=source_id):
+                # Calculate high volume vs regular deliveries
+                regular_count = 0
+                high_volume_count = 0
+
+                for order in data['orders']:
+                    if order.get('calculation_id'):
+                        calc = self.env['food.delivery.fee.calculation'].browse(order['calculation_id'])
+                        if calc.exists() and calc.high_volume_bonus:
+                            high_volume_count += 1
+                        else:
+                            regular_count += 1
                     else:
                         regular_count += 1
-                else:
-                    regular_count += 1
 
-            # Create settlement
-            settlement = self.env['food.delivery.settlement'].create({
-                'partner_id': courier.partner_id.id,
-                'partner_type': 'courier',
-                'week_start': week_start,
-                'week_end': week_end,
-                'settlement_date': fields.Date.today(),
-                'total_orders': data['total_deliveries'],
-                'total_amount_due': data['total_amount'],
-                'regular_deliveries': regular_count,
-                'high_volume_deliveries': high_volume_count,
-            })
+                # Create settlement
+                settlement = self.env['food.delivery.settlement'].create({
+                    'partner_id': courier.partner_id.id,
+                    'partner_type': 'courier',
+                    'week_start': week_start,
+                    'week_end': week_end,
+                    'settlement_date': fields.Date.today(),
+                    'total_orders': data['total_deliveries'],
+                    'total_amount_due': data['total_amount'],
+                    'regular_deliveries': regular_count,
+                    'high_volume_deliveries': high_volume_count,
+                })
 
             # Create settlement lines
-            for order in data['orders']:
-                high_volume_bonus = False
-                if order.get('calculation_id'):
-                    calc = self.env['food.delivery.fee.calculation'].browse(order['calculation_id'])
-                    if calc.exists():
-                        high_volume_bonus = calc.high_volume_bonus
-
-                self.env['food.delivery.settlement.line'].create({
-                    'settlement_id': settlement.id,
-                    'external_order_id': order['order_id'],
-                    'order_date': order['created_at'],
-                    'amount': float(order['courier_share'] or 0),
-                    'high_volume_bonus': high_volume_bonus
-                })
+            with settlement_span(self.env, 'line_create', 'courier', external_courier_id, rows=len(data['orders']),
+                                 source_id=source_id):
+                for order in data['orders']:
+                    high_volume_bonus = False
+                    if order.get('calculation_id'):
+                        calc = self.env['food.delivery.fee.calculation'].browse(order['calculation_id'])
+                        if calc.exists():
+                            high_volume_bonus = calc.high_volume_bonus
+
+                    self.env['food.delivery.settlement.line'].create({
+                        'settlement_id': settlement.id,
+                        'external_order_id': order['order_id'],
+                        'order_date': order['created_at'],
+                        'amount': float(order['courier_share'] or 0),
+                        'high_volume_bonus': high_volume_bonus
+                    })
 
             settlements.append(settlement)
 
         return settlements
 
-    def _create_restaurant_settlements(self, restaurant_data, week_start, week_end):
+    def _create_restaurant_settlements(self, restaurant_data, week_start, week_end, source=None,
+                                       restaurant_details=None):
         """Create restaurant settlements"""
         settlements = []
+        source_id = source.id if source else None
 
         for external_restaurant_id, data in restaurant_data.items():
             # Find or create restaurant partner
-            restaurant = self._find_or_create_restaurant(external_restaurant_id)
+            with settlement_span(self.env, 'partner_resolution', 'restaurant', external_restaurant_id, rows=1,
+                                 source_id=source_id):
+                restaurant = self._find_or_create_restaurant(
+                    external_restaurant_id, source, (restaurant_details or {}).get(external_restaurant_id))
 
             if not restaurant:
                 _logger.warning(f"Restaurant {external_restaurant_id} not found in Odoo")
@@ -419,46 +927,55 @@ class SettlementAutomation(models.Model):
                 f"Creating restaurant settlement for {restaurant.name}: orders={data['total_orders']}, amount={net_amount}")
 
             # Create settlement
-            settlement = self.env['food.delivery.settlement'].create({
-                'partner_id': restaurant.id,
-                'partner_type': 'restaurant',
-                'week_start': week_start,
-                'week_end': week_end,
-                'settlement_date': fields.Date.today(),
-                'total_orders': data['total_orders'],
-                'total_amount_due': net_amount,
-                'total_order_amount': data['total_order_amount'],
-                'total_delivery_fees': data['total_delivery_fees'],
-            })
+            with settlement_span(self.env, 'settlement_create', 'restaurant', external_restaurant_id, rows=1,
+                                 source_id=source_id):
+                settlement = self.env['food.delivery.settlement'].create({
+                    'partner_id': restaurant.id,
+                    'partner_type': 'restaurant',
+                    'week_start': week_start,
+                    'week_end': week_end,
+                    'settlement_date': fields.Date.today(),
+                    'total_orders': data['total_orders'],
+                    'total_amount_due': net_amount,
+                    'total_order_amount': data['total_order_amount'],
+                    'total_delivery_fees': data['total_delivery_fees'],
+                })
 
             # Create settlement lines
-            for order in data['orders']:
-                self.env['food.delivery.settlement.line'].create({
-                    'settlement_id': settlement.id,
-                    'external_order_id': order['order_id'],
-                    'order_date': order['created_at'],
-                    'amount': float(order['order_total'] or 0) - float(order['delivery_fee'] or 0),
-                    'order_amount': float(order['order_total'] or 0),
-                    'delivery_fee': float(order['delivery_fee'] or 0)
-                })
+            with settlement_span(self.env, 'line_create', 'restaurant', external_restaurant_id,
+                                 rows=len(data['orders']), source_id=source_id):
+                for order in data['orders']:
+                    self.env['food.delivery.settlement.line'].create({
+                        'settlement_id': settlement.id,
+                        'external_order_id': order['order_id'],
+                        'order_date': order['created_at'],
+                        'amount': float(order['order_total'] or 0) - float(order['delivery_fee'] or 0),
+                        'order_amount': float(order['order_total'] or 0),
+                        'delivery_fee': float(order['delivery_fee'] or 0)
+                    })
 
             settlements.append(settlement)
 
         return settlements
 
-    def _find_or_create_restaurant(self, external_restaurant_id):
-        """Find existing restaurant or create new one from external database"""
+    def _find_or_create_restaurant(self, external_restaurant_id, source=None, restaurant_data=None):
+        """Find existing restaurant or create new one from external database
+
+        External ids are namespaced by source, restaurant_data may hold details fetched in advance.
+        """
         # Try to find existing restaurant
         restaurant = self.env['res.partner'].search([
             ('external_restaurant_id', '=', external_restaurant_id),
-            ('partner_type', '=', 'restaurant')
+            ('partner_type', '=', 'restaurant'),
+            ('external_source_id', '=', source.id if source else False)
         ], limit=1)
 
         if restaurant:
             return restaurant
 
         # Fetch restaurant details from external database
-        restaurant_data = self._get_restaurant_details(external_restaurant_id)
+        if not restaurant_data:
+            restaurant_data = self._get_restaurant_details(external_restaurant_id, source)
 
         if not restaurant_data:
             _logger.error(f"Restaurant {external_restaurant_id} not found in external database")
@@ -470,7 +987,8 @@ class SettlementAutomation(models.Model):
                 external_restaurant_id=external_restaurant_id,
                 name=restaurant_data['restaurant_name'],
                 location_lat=None,
-                location_lng=None
+                location_lng=None,
+                external_source_id=source.id if source else None
             )
 
             _logger.info(f"Auto-created restaurant: {partner.name}")
@@ -480,32 +998,40 @@ class SettlementAutomation(models.Model):
             _logger.error(f"Failed to create restaurant {external_restaurant_id}: {e}")
             return None
 
-    def _get_restaurant_details(self, external_restaurant_id):
+    def _get_restaurant_details(self, external_restaurant_id, source=None):
         """Get restaurant details from external database"""
-        query = """
+        result = self._execute_external_query(
+            self._get_restaurant_details_query(), ([external_restaurant_id],), source)
+        return result[0] if result else None
+
+    def _get_restaurant_details_query(self):
+        """Query of restaurant details for a list of external ids"""
+        return """
         SELECT 
             restaurant_id,
             restaurant_name,
             restaurant_location
         FROM restaurants 
-        WHERE restaurant_id = %s
+        WHERE restaurant_id = ANY(%s)
         """
 
-        result = self._execute_external_query(query, (external_restaurant_id,))
-        return result[0] if result else None
+    def _find_or_create_courier(self, external_courier_id, source=None, courier_data=None):
+        """Find existing courier or create new one from external database
 
-    def _find_or_create_courier(self, external_courier_id):
-        """Find existing courier or create new one from external database"""
+        External ids are namespaced by source, courier_data may hold details fetched in advance.
+        """
         # Try to find existing courier
         courier = self.env['food.delivery.courier'].search([
-            ('external_courier_id', '=', external_courier_id)
+            ('external_courier_id', '=', external_courier_id),
+            ('external_source_id', '=', source.id if source else False)
         ], limit=1)
 
         if courier:
             return courier
 
         # Fetch courier details from external database
-        courier_data = self._get_courier_details(external_courier_id)
+        if not courier_data:
+            courier_data = self._get_courier_details(external_courier_id, source)
 
         if not courier_data:
             _logger.error(f"Courier {external_courier_id} not found in external database")
@@ -517,12 +1043,14 @@ class SettlementAutomation(models.Model):
                 external_courier_id=external_courier_id,
                 name=courier_data['courier_full_name'],
                 phone=None,
-                email=None
+                email=None,
+                external_source_id=source.id if source else None
             )
 
             # Create courier record
             courier = self.env['food.delivery.courier'].create({
                 'external_courier_id': external_courier_id,
+                'external_source_id': source.id if source else False,
                 'partner_id': partner.id
             })
 
@@ -533,9 +1061,14 @@ class SettlementAutomation(models.Model):
             _logger.error(f"Failed to create courier {external_courier_id}: {e}")
             return None
 
-    def _get_courier_details(self, external_courier_id):
+    def _get_courier_details(self, external_courier_id, source=None):
         """Get courier details from external database"""
-        query = """
+        result = self._execute_external_query(self._get_courier_details_query(), ([external_courier_id],), source)
+        return result[0] if result else None
+
+    def _get_courier_details_query(self):
+        """Query of courier details for a list of external ids"""
+        return """
         SELECT 
             courier_id,
             courier_full_name,
@@ -543,8 +1076,5 @@ class SettlementAutomation(models.Model):
             date_of_birth,
             gender
         FROM couriers 
-        WHERE courier_id = %s
+        WHERE courier_id = ANY(%s)
         """
-
-        result = self._execute_external_query(query, (external_courier_id,))
-        return result[0] if result else None
\ No newline at end of file
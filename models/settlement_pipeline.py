@@ -0,0 +1,122 @@
+from psycopg2.extras import RealDictCursor
+import queue
+import threading
+import logging
+
+from .external_db import get_connection_pool, pooled_connection
+from .order_buffer import OrderBuffer
+
+_logger = logging.getLogger(__name__)
+
+
+class OrderChunkPrefetcher(threading.Thread):
+    """Fetch orders sorted by partner into a bounded queue from a background thread
+
+    Every chunk put on the queue holds all orders of the partners it contains, so the
+    consumer can settle each chunk on its own. The thread never touches the Odoo
+    environment, it only uses its own pooled connection to the external database.
+    """
+
+    DONE = object()
+
+    def __init__(self, pool, query, params, partner_key, chunk_size=5000, queue_size=4):
+        super().__init__(name=f'settlement-prefetch-{partner_key}', daemon=True)
+        self.pool = pool
+        self.query = query
+        self.params = params
+        self.partner_key = partner_key
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            with pooled_connection(self.pool) as conn:
+                cursor = conn.cursor(name=f'settlement_prefetch_{self.partner_key}', cursor_factory=RealDictCursor)
+                cursor.itersize = self.chunk_size
+                cursor.execute(self.query, self.params)
+
+                pending = []
+                while not self._stop_event.is_set():
+                    rows = cursor.fetchmany(self.chunk_size)
+                    if not rows:
+                        break
+
+                    # Hold back the last partner, its orders may continue in the next fetch
+                    rows = pending + rows
+                    last_partner = rows[-1][self.partner_key]
+                    split = len(rows)
+                    while split and rows[split - 1][self.partner_key] == last_partner:
+                        split -= 1
+
+                    pending = rows[split:]
+                    if split:
+                        self._put(rows[:split])
+
+                if pending:
+                    self._put(pending)
+                cursor.close()
+
+        except Exception as e:
+            _logger.error(f"Order prefetch failed: {e}")
+            self._put(e)
+        finally:
+            self._put(self.DONE)
+
+    def _put(self, item):
+        """Block until the consumer takes the item, unless the prefetch was stopped"""
+        while not self._stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def stop(self):
+        """Stop fetching and wait for the thread to release its connection"""
+        self._stop_event.set()
+        while self.is_alive():
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.join(timeout=0.1)
+
+
+def fetch_from_source(connection_params, maxconn, fetch, *args):
+    """Open the pool of one external source and run fetch(pool, *args) on it
+
+    Runs in a worker thread, so a source that cannot be reached only holds up its own thread.
+    """
+    return fetch(get_connection_pool(connection_params, maxconn=maxconn), *args)
+
+
+def fetch_source_rows(pool, query, params):
+    """All rows of a query on one external source"""
+    with pooled_connection(pool) as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def fetch_source_week(pool, orders_query, params, courier_query, restaurant_query):
+    """Fetch the delivered orders of one external source and the details of their partners
+
+    Runs in a worker thread, so it only uses its own pooled connection and never the Odoo
+    environment. Returns the orders as an OrderBuffer and the courier and restaurant details
+    keyed by their external id.
+    """
+    with pooled_connection(pool) as conn:
+        cursor = conn.cursor(name='settlement_source_orders', cursor_factory=RealDictCursor)
+        cursor.itersize = 2000
+        cursor.execute(orders_query, params)
+        orders = OrderBuffer.from_rows(cursor)
+        cursor.close()
+
+        details = []
+        for key, query in (('courier_id', courier_query), ('restaurant_id', restaurant_query)):
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(query, (sorted(set(orders.columns[key])),))
+            details.append({row[key]: row for row in cursor.fetchall()})
+
+    return orders, details[0], details[1]
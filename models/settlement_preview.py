@@ -0,0 +1,75 @@
+from odoo import models, fields
+from datetime import timedelta
+
+
+class SettlementPreview(models.TransientModel):
+    _name = 'food.delivery.settlement.preview'
+    _description = 'Settlement Preview'
+
+    def _default_date_from(self):
+        today = fields.Date.today()
+        return today - timedelta(days=today.weekday())  # Current Monday
+
+    def _default_date_to(self):
+        return self._default_date_from() + timedelta(days=6)  # Current Sunday
+
+    date_from = fields.Date('From', required=True, default=_default_date_from)
+    date_to = fields.Date('To', required=True, default=_default_date_to)
+    line_ids = fields.One2many('food.delivery.settlement.preview.line', 'preview_id', 'Partners', readonly=True)
+
+    courier_count = fields.Integer('Couriers', readonly=True)
+    restaurant_count = fields.Integer('Restaurants', readonly=True)
+    total_orders = fields.Integer('Total Orders', readonly=True)
+    courier_amount_due = fields.Float('Courier Amount Due', digits=(10, 2), readonly=True)
+    restaurant_amount_due = fields.Float('Restaurant Amount Due', digits=(10, 2), readonly=True)
+
+    def action_compute_preview(self):
+        """Compute the preview and show it in the wizard"""
+        self.ensure_one()
+        preview = self.env['settlement.automation'].preview_settlements(self.date_from, self.date_to)
+
+        self.line_ids.unlink()
+        self.write({
+            'line_ids': [(0, 0, {
+                'partner_type': partner['partner_type'],
+                'external_id': partner['external_id'],
+                'partner_id': partner['partner_id'],
+                'partner_name': partner['partner_name'],
+                'total_orders': partner['total_orders'],
+                'total_amount_due': partner['total_amount_due'],
+                'regular_deliveries': partner['regular_deliveries'],
+                'high_volume_deliveries': partner['high_volume_deliveries'],
+                'total_order_amount': partner['total_order_amount'],
+                'total_delivery_fees': partner['total_delivery_fees'],
+            }) for partner in preview['partners']],
+            **preview['totals'],
+        })
+
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+
+class SettlementPreviewLine(models.TransientModel):
+    _name = 'food.delivery.settlement.preview.line'
+    _description = 'Settlement Preview Line'
+    _order = 'partner_type, total_amount_due desc'
+
+    preview_id = fields.Many2one('food.delivery.settlement.preview', 'Preview', required=True, ondelete='cascade')
+    partner_type = fields.Selection([
+        ('courier', 'Courier'),
+        ('restaurant', 'Restaurant')
+    ], string='Partner Type', required=True)
+    external_id = fields.Integer('External ID')
+    partner_id = fields.Many2one('res.partner', 'Partner')
+    partner_name = fields.Char('Name')
+    total_orders = fields.Integer('Total Orders/Deliveries')
+    total_amount_due = fields.Float('Total Amount Due', digits=(10, 2))
+    regular_deliveries = fields.Integer('Regular Deliveries')
+    high_volume_deliveries = fields.Integer('High Volume Deliveries')
+    total_order_amount = fields.Float('Total Order Amount', digits=(10, 2))
+    total_delivery_fees = fields.Float('Total Delivery Fees Deducted', digits=(10, 2))
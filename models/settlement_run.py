@@ -0,0 +1,272 @@
+from odoo import models, fields, api
+from contextlib import contextmanager, nullcontext
+import base64
+import cProfile
+import io
+import marshal
+import pstats
+import time
+import logging
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_logger = logging.getLogger(__name__)
+
+RECORDER_CONTEXT_KEY = 'settlement_run_recorder'
+
+# Metrics aggregated with max() instead of sum()
+PEAK_METRICS = ('peak_rss_mb',)
+
+PHASES = [
+    ('fetch', 'External Fetch'),
+    ('group', 'Grouping'),
+    ('partner_resolution', 'Partner Resolution'),
+    ('settlement_create', 'Settlement Creation'),
+    ('line_create', 'Line Creation'),
+    ('vendor_bill', 'Vendor Bill Creation'),
+]
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process so far, 0 where the platform does not report it"""
+    if resource is None:
+        return 0.0
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class SettlementRunRecorder:
+    """Collect timing, query and row counts per phase and partner during a settlement run"""
+
+    def __init__(self, cr):
+        self.cr = cr
+        self.external_queries = 0
+        # (phase, partner_type, external_partner_id, external_source_id) -> metrics, external ids overlap between sources
+        self.spans = {}
+        self._active = []
+
+    def count_external_query(self, count=1):
+        self.external_queries += count
+
+    @contextmanager
+    def span(self, phase, partner_type=None, external_id=None, rows=0, source_id=None):
+        """Measure a block, time spent in nested spans is only counted in the innermost one
+
+        Yields a dict whose ``rows`` entry can be updated once the row count is known.
+        """
+        start_time = time.perf_counter()
+        start_queries = self.cr.sql_log_count
+        start_external = self.external_queries
+        counters = {'rows': rows}
+        self._active.append((phase, partner_type, external_id, source_id))
+        try:
+            yield counters
+        finally:
+            key = self._active.pop()
+            seconds = time.perf_counter() - start_time
+            queries = self.cr.sql_log_count - start_queries
+            external = self.external_queries - start_external
+
+            metrics = self.spans.setdefault(key, {'duration': 0.0, 'query_count': 0, 'external_query_count': 0,
+                                                  'row_count': 0, 'calls': 0, 'peak_rss_mb': 0.0})
+            # The process high-water mark when the phase ends, a jump shows the phase that raised it
+            metrics['peak_rss_mb'] = max(metrics['peak_rss_mb'], peak_rss_mb())
+            metrics['duration'] += seconds
+            metrics['query_count'] += queries
+            metrics['external_query_count'] += external
+            metrics['row_count'] += counters['rows']
+            metrics['calls'] += 1
+
+            if self._active:
+                parent = self.spans.setdefault(self._active[-1], {
+                    'duration': 0.0, 'query_count': 0, 'external_query_count': 0, 'row_count': 0, 'calls': 0,
+                    'peak_rss_mb': 0.0})
+                parent['duration'] -= seconds
+                parent['query_count'] -= queries
+                parent['external_query_count'] -= external
+
+    def phase_totals(self):
+        """Metrics summed over all partners for each phase"""
+        totals = {}
+        for (phase, _partner_type, _external_id, _source_id), metrics in self.spans.items():
+            total = totals.setdefault(phase, dict.fromkeys(metrics, 0))
+            for name, value in metrics.items():
+                total[name] = max(total[name], value) if name in PEAK_METRICS else total[name] + value
+        return totals
+
+
+def settlement_span(env, phase, partner_type=None, external_id=None, rows=0, source_id=None):
+    """Span of the settlement run recorder in the context, if any"""
+    recorder = env.context.get(RECORDER_CONTEXT_KEY)
+    if not recorder:
+        return nullcontext({'rows': rows})
+    return recorder.span(phase, partner_type, external_id, rows, source_id)
+
+
+class SettlementRun(models.Model):
+    _name = 'food.delivery.settlement.run'
+    _description = 'Settlement Run'
+    _order = 'started_at desc'
+
+    name = fields.Char('Run', compute='_compute_name', store=True)
+    week_start = fields.Date('Week Start Date', readonly=True)
+    week_end = fields.Date('Week End Date', readonly=True)
+    started_at = fields.Datetime('Started At', readonly=True, default=fields.Datetime.now)
+    finished_at = fields.Datetime('Finished At', readonly=True)
+    duration = fields.Float('Duration (s)', digits=(12, 3), readonly=True)
+    state = fields.Selection([
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed')
+    ], string='Status', default='running', readonly=True)
+    error_message = fields.Text('Error', readonly=True)
+
+    order_count = fields.Integer('Orders', readonly=True)
+    settlement_count = fields.Integer('Settlements', readonly=True)
+    query_count = fields.Integer('SQL Queries', readonly=True)
+    external_query_count = fields.Integer('External Queries', readonly=True)
+
+    phase_ids = fields.One2many('food.delivery.settlement.run.phase', 'run_id', 'Phases', readonly=True,
+                                domain=[('partner_type', '=', False)])
+    partner_phase_ids = fields.One2many('food.delivery.settlement.run.phase', 'run_id', 'Partner Phases',
+                                        readonly=True, domain=[('partner_type', '!=', False)])
+
+    profile_mode = fields.Selection([
+        ('cprofile', 'cProfile'),
+        ('pyinstrument', 'pyinstrument')
+    ], string='Profiler', readonly=True)
+    profile_summary = fields.Text('Profile Summary', readonly=True)
+    profile_attachment_id = fields.Many2one('ir.attachment', 'Profile', readonly=True)
+
+    @api.depends('week_start', 'week_end', 'started_at')
+    def _compute_name(self):
+        for record in self:
+            record.name = f"Settlement Run {record.week_start} to {record.week_end} ({record.started_at})"
+
+    def _start_profiler(self):
+        """Start the profiler configured with settlement.profile_mode, if any"""
+        mode = self.env['ir.config_parameter'].sudo().get_param('settlement.profile_mode')
+        if mode == 'pyinstrument' and not pyinstrument:
+            _logger.warning("pyinstrument is not installed, profiling the settlement run with cProfile")
+            mode = 'cprofile'
+
+        if mode == 'pyinstrument':
+            profiler = pyinstrument.Profiler()
+        elif mode == 'cprofile':
+            profiler = cProfile.Profile()
+        else:
+            return None
+
+        self.profile_mode = mode
+        if mode == 'pyinstrument':
+            profiler.start()
+        else:
+            profiler.enable()
+        return profiler
+
+    def _stop_profiler(self, profiler):
+        """Stop the profiler and attach its output to the run"""
+        if self.profile_mode == 'pyinstrument':
+            profiler.stop()
+            summary = profiler.output_text(unicode=True, color=False)
+            content = profiler.output_html().encode('utf-8')
+            filename, mimetype = f'settlement_run_{self.id}.html', 'text/html'
+        else:
+            profiler.disable()
+            stream = io.StringIO()
+            stats = pstats.Stats(profiler, stream=stream)
+            stats.sort_stats('cumulative').print_stats(50)
+            summary = stream.getvalue()
+            # Same format as Stats.dump_stats, loadable with pstats or snakeviz
+            content = marshal.dumps(stats.stats)
+            filename, mimetype = f'settlement_run_{self.id}.prof', 'application/octet-stream'
+
+        attachment = self.env['ir.attachment'].sudo().create({
+            'name': filename,
+            'datas': base64.b64encode(content),
+            'mimetype': mimetype,
+            'res_model': self._name,
+            'res_id': self.id,
+        })
+        self.write({
+            'profile_summary': summary,
+            'profile_attachment_id': attachment.id,
+        })
+
+    def _record(self, recorder, state, order_count=0, settlement_count=0, error_message=None):
+        """Persist the recorder's spans on the run"""
+        finished_at = fields.Datetime.now()
+        phase_totals = recorder.phase_totals()
+
+        # Resolve partners of the per-partner spans in one query per partner type and source
+        partners = {}
+        for partner_type in ('courier', 'restaurant'):
+            external_ids_by_source = {}
+            for _phase, span_type, external_id, source_id in recorder.spans:
+                if span_type == partner_type:
+                    external_ids_by_source.setdefault(source_id, set()).add(external_id)
+            field = f'external_{partner_type}_id'
+            for source_id, external_ids in external_ids_by_source.items():
+                for partner in self.env['res.partner'].search_read([
+                    (field, 'in', list(external_ids)),
+                    ('partner_type', '=', partner_type),
+                    ('external_source_id', '=', source_id or False)
+                ], [field]):
+                    partners[(partner_type, partner[field], source_id)] = partner['id']
+
+        phase_vals = [{
+            'run_id': self.id,
+            'phase': phase,
+            **metrics,
+        } for phase, metrics in phase_totals.items()]
+        phase_vals += [{
+            'run_id': self.id,
+            'phase': phase,
+            'partner_type': partner_type,
+            'external_partner_id': external_id,
+            'external_source_id': source_id or False,
+            'partner_id': partners.get((partner_type, external_id, source_id)),
+            **metrics,
+        } for (phase, partner_type, external_id, source_id), metrics in recorder.spans.items() if partner_type]
+        self.env['food.delivery.settlement.run.phase'].create(phase_vals)
+
+        self.write({
+            'state': state,
+            'finished_at': finished_at,
+            'duration': (finished_at - self.started_at).total_seconds(),
+            'order_count': order_count,
+            'settlement_count': settlement_count,
+            'query_count': sum(metrics['query_count'] for metrics in phase_totals.values()),
+            'external_query_count': recorder.external_queries,
+            'error_message': error_message,
+        })
+
+
+class SettlementRunPhase(models.Model):
+    _name = 'food.delivery.settlement.run.phase'
+    _description = 'Settlement Run Phase'
+    _order = 'run_id, duration desc'
+
+    run_id = fields.Many2one('food.delivery.settlement.run', 'Run', required=True, index=True, ondelete='cascade')
+    phase = fields.Selection(PHASES, string='Phase', required=True)
+    partner_type = fields.Selection([
+        ('courier', 'Courier'),
+        ('restaurant', 'Restaurant')
+    ], string='Partner Type')
+    external_partner_id = fields.Integer('External Partner ID')
+    external_source_id = fields.Many2one('food.delivery.external.source', 'External Source')
+    partner_id = fields.Many2one('res.partner', 'Partner')
+    duration = fields.Float('Duration (s)', digits=(12, 4))
+    query_count = fields.Integer('SQL Queries')
+    external_query_count = fields.Integer('External Queries')
+    row_count = fields.Integer('Rows')
+    calls = fields.Integer('Calls')
+    peak_rss_mb = fields.Float('Peak RSS (MB)', digits=(12, 1))
@@ -0,0 +1,119 @@
+from array import array
+import heapq
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distances in km from one point to many, vectorized with NumPy when available"""
+    if np is not None:
+        lat1, lng1 = np.radians(lat), np.radians(lng)
+        lat2, lng2 = np.radians(np.asarray(lats, dtype=np.float64)), np.radians(np.asarray(lngs, dtype=np.float64))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    cos_lat1 = math.cos(lat1)
+    distances = []
+    for other_lat, other_lng in zip(lats, lngs):
+        lat2, lng2 = math.radians(other_lat), math.radians(other_lng)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+    return distances
+
+
+class GridIndex:
+    """Fixed-size lat/lng grid over partner locations
+
+    Points are bucketed into cells of ``cell_size`` degrees. A lookup only computes exact
+    distances for points in the cells overlapping the bounding box of the search circle.
+    """
+
+    def __init__(self, points, cell_size=0.05):
+        self.cell_size = cell_size
+        self.partner_ids = array('q')
+        self.external_ids = array('q')
+        self.names = []
+        lats, lngs = array('d'), array('d')
+        self.cells = {}
+
+        for partner_id, external_id, name, lat, lng in points:
+            position = len(self.partner_ids)
+            self.partner_ids.append(partner_id)
+            self.external_ids.append(external_id or 0)
+            self.names.append(name)
+            lats.append(lat)
+            lngs.append(lng)
+            self.cells.setdefault(self._cell(lat, lng), array('q')).append(position)
+
+        if np is not None:
+            self.lats, self.lngs = np.frombuffer(lats, dtype=np.float64), np.frombuffer(lngs, dtype=np.float64)
+        else:
+            self.lats, self.lngs = lats, lngs
+
+    def __len__(self):
+        return len(self.partner_ids)
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+
+    def within(self, lat, lng, radius_km, limit=None):
+        """Partners within radius_km of a point, nearest first"""
+        lat_delta = radius_km / KM_PER_DEGREE
+        lng_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        min_row, min_column = self._cell(lat - lat_delta, lng - lng_delta)
+        max_row, max_column = self._cell(lat + lat_delta, lng + lng_delta)
+
+        candidates = array('q')
+        for row in range(min_row, max_row + 1):
+            for column in range(min_column, max_column + 1):
+                cell = self.cells.get((row, column))
+                if cell:
+                    candidates.extend(cell)
+        if not candidates:
+            return []
+
+        if np is not None:
+            positions = np.frombuffer(candidates, dtype=np.int64)
+            distances = haversine_km(lat, lng, self.lats[positions], self.lngs[positions])
+            inside = distances <= radius_km
+            positions, distances = positions[inside], distances[inside]
+            order = np.argsort(distances, kind='stable')[:limit]
+            matches = zip(positions[order].tolist(), distances[order].tolist())
+        else:
+            distances = haversine_km(lat, lng, [self.lats[p] for p in candidates], [self.lngs[p] for p in candidates])
+            inside = ((p, d) for p, d in zip(candidates, distances) if d <= radius_km)
+            if limit is None:
+                matches = sorted(inside, key=lambda match: match[1])
+            else:
+                matches = heapq.nsmallest(limit, inside, key=lambda match: match[1])
+
+        return [self._entry(position, distance) for position, distance in matches]
+
+    def nearest(self, lat, lng, k, max_radius_km=50.0):
+        """The k partners nearest to a point, searching circles of doubling radius up to max_radius_km"""
+        radius_km = self.cell_size * KM_PER_DEGREE / 2
+        while True:
+            radius_km = min(radius_km, max_radius_km)
+            # Every partner closer than the k-th match lies inside the searched circle
+            matches = self.within(lat, lng, radius_km, limit=k)
+            if len(matches) >= k or radius_km >= max_radius_km:
+                return matches
+            radius_km *= 2
+
+    def _entry(self, position, distance):
+        return {
+            'partner_id': self.partner_ids[position],
+            'external_id': self.external_ids[position],
+            'name': self.names[position],
+            'lat': float(self.lats[position]),
+            'lng': float(self.lngs[position]),
+            'distance_km': round(distance, 3),
+        }
@@ -0,0 +1,42 @@
+"""Backfill partners of every external courier, restaurant and customer into Odoo
+
+Runs the same resumable backfill as the cron from the command line, committing after
+every chunk and logging progress. Interrupt it at any time, the next run resumes after
+the last committed chunk. Use --restart to diff the whole tables again.
+
+Example:
+    python scripts/backfill_partners.py --odoo-db odoo --odoo-config /etc/odoo/odoo.conf \
+        --tables couriers restaurants --chunk-size 10000
+"""
+import argparse
+import json
+import logging
+
+from odoo_env import odoo_environment
+
+TABLES = ['couriers', 'restaurants', 'customers']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--odoo-db', required=True)
+    parser.add_argument('--odoo-config')
+    parser.add_argument('--tables', nargs='+', choices=TABLES, default=TABLES)
+    parser.add_argument('--chunk-size', type=int, help='rows per chunk, overrides backfill.chunk_size')
+    parser.add_argument('--restart', action='store_true', help='start again from the first external id')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    args = parse_args()
+
+    with odoo_environment(args.odoo_db, args.odoo_config) as env:
+        results = env['food.delivery.partner.backfill']._run_backfill(
+            tables=args.tables, restart=args.restart, chunk_size=args.chunk_size)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Benchmark the weekly settlement pipeline phase by phase
+
+Runs the settlement pipeline for one week inside a transaction that is rolled back, so runs
+are repeatable, and reads the per-phase timings from the settlement run recorder.
+Each result is appended to a JSON lines file and compared with the previous run of the
+same label to surface regressions.
+
+Example:
+    python scripts/benchmark_settlements.py --odoo-db odoo --odoo-config /etc/odoo/odoo.conf \
+        --label 500k-orders --repeat 3 --results bench_results.jsonl
+"""
+import argparse
+import json
+import logging
+import statistics
+import subprocess
+import sys
+from datetime import date, datetime, timedelta
+
+from odoo_env import odoo_environment
+
+_logger = logging.getLogger('benchmark_settlements')
+
+PHASES = ['fetch', 'group', 'partner_resolution', 'settlement_create', 'line_create', 'vendor_bill']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--odoo-db', required=True)
+    parser.add_argument('--odoo-config')
+    parser.add_argument('--week-start', type=date.fromisoformat,
+                        help='Monday of the week to settle, defaults to the previous week')
+    parser.add_argument('--label', default='default', help='dataset label, results are compared per label')
+    parser.add_argument('--repeat', type=int, default=1, help='number of runs, the median is recorded')
+    parser.add_argument('--results', default='bench_results.jsonl')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='relative slowdown reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    return parser.parse_args()
+
+
+def run_once(env, week_start, week_end):
+    """Run the settlement pipeline once with the built-in phase recorder and roll back"""
+    from odoo.addons.food_delivery.models.settlement_run import SettlementRunRecorder, RECORDER_CONTEXT_KEY
+
+    recorder = SettlementRunRecorder(env.cr)
+    automation = env['settlement.automation'].with_context(**{RECORDER_CONTEXT_KEY: recorder})
+
+    try:
+        order_count, _settlements = automation._generate_settlements(week_start, week_end)
+        env.flush_all()
+    finally:
+        env.cr.rollback()
+        env.invalidate_all()
+
+    totals = recorder.phase_totals()
+    phases = {}
+    for name in PHASES:
+        phase = totals.get(name, {'duration': 0.0, 'query_count': 0, 'external_query_count': 0, 'row_count': 0,
+                                  'peak_rss_mb': 0.0})
+        phases[name] = {
+            'seconds': phase['duration'],
+            'queries': phase['query_count'],
+            'external_queries': phase['external_query_count'],
+            'rows': phase['row_count'],
+            'rows_per_second': phase['row_count'] / phase['duration'] if phase['duration'] else 0,
+            'peak_rss_mb': phase['peak_rss_mb'],
+        }
+    return phases, order_count
+
+
+def median_phases(runs):
+    """Median of every metric across runs"""
+    return {
+        name: {
+            metric: statistics.median(run[name][metric] for run in runs)
+            for metric in runs[0][name]
+        }
+        for name in PHASES
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(path, label):
+    """Last recorded result for the same dataset label"""
+    previous = None
+    try:
+        with open(path) as results:
+            for line in results:
+                result = json.loads(line)
+                if result.get('label') == label:
+                    previous = result
+    except FileNotFoundError:
+        pass
+    return previous
+
+
+def compare(previous, current, tolerance):
+    """Print per-phase changes against the previous result, return the regressed phases"""
+    regressions = []
+    print(f"{'phase':<20}{'seconds':>12}{'previous':>12}{'change':>10}{'queries':>10}{'rows/s':>12}{'rss MB':>10}")
+    for name in PHASES:
+        phase = current['phases'][name]
+        before = previous['phases'][name] if previous else None
+        change = ''
+        if before and before['seconds']:
+            ratio = phase['seconds'] / before['seconds'] - 1
+            change = f"{ratio:+.1%}"
+            if ratio > tolerance:
+                regressions.append(name)
+        print(f"{name:<20}{phase['seconds']:>12.3f}{before['seconds'] if before else 0:>12.3f}"
+              f"{change:>10}{phase['queries']:>10.0f}{phase['rows_per_second']:>12.0f}{phase['peak_rss_mb']:>10.1f}")
+    return regressions
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args()
+
+    today = date.today()
+    week_start = args.week_start or today - timedelta(days=today.weekday() + 7)
+    week_end = week_start + timedelta(days=6)
+
+    with odoo_environment(args.odoo_db, args.odoo_config) as env:
+        module_version = env['ir.module.module'].search([('name', '=', 'food_delivery')], limit=1).latest_version
+        runs = []
+        for index in range(args.repeat):
+            phases, order_count = run_once(env, week_start, week_end)
+            _logger.info(f"Run {index + 1}/{args.repeat}: {sum(p['seconds'] for p in phases.values()):.2f}s "
+                         f"for {order_count} orders")
+            runs.append(phases)
+
+    phases = median_phases(runs)
+    result = {
+        'label': args.label,
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'module_version': module_version,
+        'git_revision': git_revision(),
+        'week_start': str(week_start),
+        'orders': order_count,
+        'repeat': args.repeat,
+        'total_seconds': sum(phase['seconds'] for phase in phases.values()),
+        'peak_rss_mb': max(phase['peak_rss_mb'] for phase in phases.values()),
+        'phases': phases,
+    }
+
+    previous = load_previous(args.results, args.label)
+    regressions = compare(previous, result, args.tolerance)
+
+    with open(args.results, 'a') as results:
+        results.write(json.dumps(result) + '\n')
+
+    if regressions:
+        print(f"Regressions above {args.tolerance:.0%}: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""Fill the mobile app database (and optionally Odoo) with synthetic settlement data
+
+Example:
+    python scripts/generate_synthetic_data.py --host localhost --port 5433 --dbname mobile_app_database \
+        --couriers 2000 --restaurants 800 --customers 50000 --orders-per-week 500000 --weeks 2 \
+        --odoo-db odoo --odoo-config /etc/odoo/odoo.conf
+"""
+import argparse
+import csv
+import io
+import logging
+import random
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+_logger = logging.getLogger('generate_synthetic_data')
+
+COPY_BATCH_SIZE = 100000
+ODOO_BATCH_SIZE = 1000
+
+ORDER_STATUSES = ['delivered', 'cancelled', 'refunded']
+ORDER_STATUS_WEIGHTS = [90, 6, 4]
+
+# Share of orders per hour of day, lunch and dinner peaks
+HOURLY_WEIGHTS = [1, 1, 1, 1, 1, 1, 2, 3, 4, 5, 6, 10, 14, 12, 7, 5, 6, 9, 14, 16, 13, 8, 4, 2]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default='5432')
+    parser.add_argument('--dbname', default='mobile_app_database')
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--couriers', type=int, default=500)
+    parser.add_argument('--restaurants', type=int, default=200)
+    parser.add_argument('--customers', type=int, default=10000)
+    parser.add_argument('--orders-per-week', type=int, default=100000)
+    parser.add_argument('--weeks', type=int, default=1,
+                        help='number of weeks to generate, ending with the previous settlement week')
+    parser.add_argument('--skew', type=float, default=1.1,
+                        help='zipf exponent for partner popularity, 0 for a uniform distribution')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--truncate', action='store_true', help='empty the external tables first')
+    parser.add_argument('--odoo-db', help='also create couriers and fee calculations in this Odoo database')
+    parser.add_argument('--odoo-config', help='Odoo configuration file')
+    return parser.parse_args()
+
+
+def zipf_cum_weights(count, skew):
+    """Cumulative weights where the i-th partner gets 1 / (i + 1) ** skew of the traffic"""
+    cum_weights = []
+    total = 0.0
+    for rank in range(count):
+        total += 1.0 / (rank + 1) ** skew
+        cum_weights.append(total)
+    return cum_weights
+
+
+def copy_rows(cursor, table, columns, rows):
+    """COPY rows into table in batches of COPY_BATCH_SIZE"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+
+    def flush():
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        buffer.seek(0)
+        buffer.truncate()
+
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % COPY_BATCH_SIZE == 0:
+            flush()
+    if buffer.tell():
+        flush()
+    return count
+
+
+def insert_partners(cursor, args, rnd):
+    """Insert customers, restaurants and couriers, return their new ids"""
+    genders = ['Male', 'Female']
+
+    def people(prefix, count):
+        for i in range(count):
+            yield (f'{prefix} {i + 1}', f'{rnd.randint(1, 999)} Street {i % 97}, Baghdad, Iraq',
+                   date(1970, 1, 1) + timedelta(days=rnd.randint(0, 12000)), rnd.choice(genders))
+
+    ids = {}
+    for table, key, columns, rows in [
+        ('customers', 'customer_id', ['customer_full_name', 'customer_address', 'date_of_birth', 'gender'],
+         people('Customer', args.customers)),
+        ('couriers', 'courier_id', ['courier_full_name', 'courier_address', 'date_of_birth', 'gender'],
+         people('Courier', args.couriers)),
+        ('restaurants', 'restaurant_id', ['restaurant_name', 'restaurant_location'],
+         ((f'Restaurant {i + 1}', f'{i + 1} Market St, Baghdad, Iraq') for i in range(args.restaurants))),
+    ]:
+        cursor.execute(f"SELECT COALESCE(MAX({key}), 0) FROM {table}")
+        last_id = cursor.fetchone()[0]
+        copy_rows(cursor, table, columns, rows)
+        cursor.execute(f"SELECT {key} FROM {table} WHERE {key} > %s ORDER BY {key}", (last_id,))
+        ids[table] = [row[0] for row in cursor.fetchall()]
+        _logger.info(f"Inserted {len(ids[table])} {table}")
+    return ids
+
+
+def generate_orders(args, rnd, ids, week_starts):
+    """Yield order rows with skewed courier and restaurant popularity"""
+    courier_weights = zipf_cum_weights(len(ids['couriers']), args.skew)
+    restaurant_weights = zipf_cum_weights(len(ids['restaurants']), args.skew)
+    hour_weights = list(accumulate(HOURLY_WEIGHTS))
+
+    for week_start in week_starts:
+        couriers = rnd.choices(ids['couriers'], cum_weights=courier_weights, k=args.orders_per_week)
+        restaurants = rnd.choices(ids['restaurants'], cum_weights=restaurant_weights, k=args.orders_per_week)
+        hours = rnd.choices(range(24), cum_weights=hour_weights, k=args.orders_per_week)
+        statuses = rnd.choices(ORDER_STATUSES, weights=ORDER_STATUS_WEIGHTS, k=args.orders_per_week)
+
+        for courier_id, restaurant_id, hour, status in zip(couriers, restaurants, hours, statuses):
+            created_at = datetime.combine(week_start, datetime.min.time()) + timedelta(
+                days=rnd.randint(0, 6), hours=hour, seconds=rnd.randint(0, 3599))
+            distance = rnd.uniform(0.5, 15)
+            delivery_fee = 2.0 if distance < 5 else 3.0 if distance < 7 else 5.0
+            cost = round(rnd.lognormvariate(3, 0.5), 2)
+            yield (
+                created_at, created_at, rnd.choice(ids['customers']), restaurant_id, courier_id, status,
+                'Synthetic order', 'Synthetic delivery location', cost, delivery_fee,
+                round(delivery_fee * 0.6, 2), round(delivery_fee * 0.4, 2),
+            )
+
+
+def create_odoo_calculations(args, conn, first_order_id, ids):
+    """Create couriers and fee calculations in Odoo and link them to the generated orders"""
+    from odoo_env import odoo_environment
+
+    with odoo_environment(args.odoo_db, args.odoo_config) as env:
+        existing = set(env['food.delivery.courier'].search([
+            ('external_courier_id', 'in', ids['couriers'])
+        ]).mapped('external_courier_id'))
+        missing = [courier_id for courier_id in ids['couriers'] if courier_id not in existing]
+        for start in range(0, len(missing), ODOO_BATCH_SIZE):
+            batch = missing[start:start + ODOO_BATCH_SIZE]
+            partners = env['res.partner'].create([{
+                'name': f'Courier {courier_id}',
+                'partner_type': 'courier',
+                'external_courier_id': courier_id,
+                'supplier_rank': 1,
+                'is_company': True,
+            } for courier_id in batch])
+            env['food.delivery.courier'].create([{
+                'external_courier_id': courier_id,
+                'partner_id': partner.id,
+            } for courier_id, partner in zip(batch, partners)])
+        _logger.info(f"Created {len(missing)} couriers in Odoo")
+
+        courier_map = dict(env['food.delivery.courier'].search([
+            ('external_courier_id', 'in', ids['couriers'])
+        ]).mapped(lambda c: (c.external_courier_id, c.id)))
+
+        # Busiest couriers are the first ids, they earn the high volume bonus
+        busy_couriers = set(ids['couriers'][:max(1, len(ids['couriers']) // 20)])
+
+        cursor = conn.cursor(name='synthetic_orders')
+        cursor.itersize = ODOO_BATCH_SIZE
+        cursor.execute("""
+            SELECT order_id, courier_id, delivery_fee, created_at FROM orders
+            WHERE order_id >= %s AND order_status = 'delivered'
+            ORDER BY order_id
+        """, (first_order_id,))
+
+        update_cursor = conn.cursor()
+        created = 0
+        while True:
+            rows = cursor.fetchmany(ODOO_BATCH_SIZE)
+            if not rows:
+                break
+            vals_list = []
+            for order_id, courier_id, delivery_fee, created_at in rows:
+                high_volume = courier_id in busy_couriers
+                courier_percentage = 65 if high_volume else 60
+                vals_list.append({
+                    'external_order_id': order_id,
+                    'distance_km': 3.0 if delivery_fee <= 2 else 6.0 if delivery_fee <= 3 else 9.0,
+                    'delivery_fee': float(delivery_fee),
+                    'courier_share': float(delivery_fee) * courier_percentage / 100,
+                    'company_share': float(delivery_fee) * (100 - courier_percentage) / 100,
+                    'courier_id': courier_map[courier_id],
+                    'calculation_date': created_at,
+                    'high_volume_bonus': high_volume,
+                })
+            calculations = env['food.delivery.fee.calculation'].create(vals_list)
+            execute_values(update_cursor, """
+                UPDATE orders o SET
+                    odoo_calculation_id = v.calculation_id,
+                    courier_share = v.courier_share,
+                    company_share = v.company_share
+                FROM (VALUES %s) AS v(order_id, calculation_id, courier_share, company_share)
+                WHERE o.order_id = v.order_id
+            """, [(calc.external_order_id, calc.id, calc.courier_share, calc.company_share)
+                  for calc in calculations])
+            env.invalidate_all()
+            created += len(calculations)
+        cursor.close()
+        _logger.info(f"Created {created} fee calculations in Odoo")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args()
+    rnd = random.Random(args.seed)
+
+    today = date.today()
+    last_week_start = today - timedelta(days=today.weekday() + 7)  # Previous Monday
+    week_starts = [last_week_start - timedelta(weeks=i) for i in reversed(range(args.weeks))]
+
+    conn = psycopg2.connect(host=args.host, port=args.port, dbname=args.dbname,
+                            user=args.user, password=args.password)
+    try:
+        cursor = conn.cursor()
+        if args.truncate:
+            cursor.execute("TRUNCATE orders, couriers, restaurants, customers RESTART IDENTITY")
+
+        ids = insert_partners(cursor, args, rnd)
+
+        cursor.execute("SELECT COALESCE(MAX(order_id), 0) + 1 FROM orders")
+        first_order_id = cursor.fetchone()[0]
+        count = copy_rows(cursor, 'orders', [
+            'created_at', 'updated_at', 'customer_id', 'restaurant_id', 'courier_id', 'order_status',
+            'items', 'delivery_location', 'cost', 'delivery_fee', 'courier_share', 'company_share',
+        ], generate_orders(args, rnd, ids, week_starts))
+        _logger.info(f"Inserted {count} orders for weeks starting {', '.join(map(str, week_starts))}")
+
+        if args.odoo_db:
+            create_odoo_calculations(args, conn, first_order_id, ids)
+
+        cursor.execute("ANALYZE orders")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
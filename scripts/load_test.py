@@ -0,0 +1,288 @@
+"""Load test the delivery API routes with many concurrent clients
+
+Replays a weighted mix of fee quotes, order completions and courier creations against a
+running Odoo server and reports throughput, latency percentiles, error and serialization
+failure rates and per-route SQL query counts (read from the X-Query-Count diagnostic header).
+
+Example:
+    python scripts/load_test.py --url http://localhost:8069 --db odoo --clients 50 --duration 60 \
+        --mix quote=70,complete=25,create=5 --courier-ids 1-500 --report load_report.json \
+        --compare previous_report.json
+
+New external order and courier ids are numbered from --id-base. They are stored in integer
+columns, so they must stay below 2**31. The default base moves by 100000 every minute, pass
+--id-base explicitly when a run creates more ids than that or runs follow each other closely.
+"""
+import argparse
+import collections
+import itertools
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+_logger = logging.getLogger('load_test')
+
+ROUTES = {
+    'quote': '/api/delivery/calculate_fee',
+    'complete': '/api/delivery/order_completed',
+    'create': '/api/delivery/courier/create',
+}
+
+# External ids are stored in PostgreSQL integer columns
+MAX_EXTERNAL_ID = 2 ** 31 - 1
+
+SERIALIZATION_ERRORS = ('SerializationFailure', 'TransactionRollbackError', 'DeadlockDetected', 'LockNotAvailable')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8069')
+    parser.add_argument('--db', help='database name, needed when the server hosts several databases')
+    parser.add_argument('--clients', type=int, default=20, help='number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds of traffic excluded from the report')
+    parser.add_argument('--mix', default='quote=70,complete=25,create=5', help='weighted route mix')
+    parser.add_argument('--courier-ids', default='1-100', help='range of existing external courier ids')
+    parser.add_argument('--id-base', type=int, default=default_id_base(),
+                        help='first external order and courier id created by the run')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--report', help='write the machine-readable report to this JSON file')
+    parser.add_argument('--compare', help='previous JSON report to compare with')
+    return parser.parse_args()
+
+
+def default_id_base():
+    # Blocks of 100000 ids per minute, cycling in about a week, above the ids of real data
+    return 1_000_000_000 + (int(time.time()) // 60 % 10_000) * 100_000
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, weight = part.split('=')
+        if name not in ROUTES:
+            raise SystemExit(f"Unknown route '{name}' in mix, use {', '.join(ROUTES)}")
+        weights[name] = float(weight)
+    return weights
+
+
+def parse_range(value):
+    first, _, last = value.partition('-')
+    return int(first), int(last or first)
+
+
+class Stats:
+    """Thread-safe collection of per-route samples"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = collections.defaultdict(list)
+
+    def add(self, route, latency, outcome, query_count):
+        with self.lock:
+            self.samples[route].append((latency, outcome, query_count))
+
+
+class IdRangeExhausted(Exception):
+    pass
+
+
+def next_external_id(sequence):
+    external_id = next(sequence)
+    if external_id > MAX_EXTERNAL_ID:
+        raise IdRangeExhausted(f"External id {external_id} exceeds {MAX_EXTERNAL_ID}, use a lower --id-base")
+    return external_id
+
+
+class Client(threading.Thread):
+    """One simulated mobile backend worker issuing requests back to back"""
+
+    # Shared sequences so external ids never collide between clients, set up by main()
+    order_ids = None
+    courier_ids = None
+
+    def __init__(self, args, weights, stats, start_measure, stop_at, seed):
+        super().__init__(daemon=True)
+        self.args = args
+        self.routes = list(weights)
+        self.cum_weights = list(itertools.accumulate(weights.values()))
+        self.stats = stats
+        self.start_measure = start_measure
+        self.stop_at = stop_at
+        self.random = random.Random(seed)
+        self.courier_range = parse_range(args.courier_ids)
+        self.pending_calculations = collections.deque(maxlen=100)
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json', 'X-Diagnostics': '1'})
+        if args.db:
+            self.session.headers['X-Odoo-Database'] = args.db
+
+    def run(self):
+        while time.monotonic() < self.stop_at:
+            route = self.random.choices(self.routes, cum_weights=self.cum_weights)[0]
+            if route == 'complete' and not self.pending_calculations:
+                route = 'quote'
+            try:
+                params = self.build_params(route)
+            except IdRangeExhausted as e:
+                _logger.error(str(e))
+                return
+            self.call(route, params)
+
+    def build_params(self, route):
+        if route == 'quote':
+            return {
+                'distance_km': round(self.random.uniform(0.5, 15), 2),
+                'courier_id': self.random.randint(*self.courier_range),
+            }
+        if route == 'complete':
+            return {
+                'external_order_id': next_external_id(self.order_ids),
+                'calculation_id': self.pending_calculations.popleft(),
+                'order_total': round(self.random.uniform(5, 80), 2),
+            }
+        courier_id = next_external_id(self.courier_ids)
+        return {'external_courier_id': courier_id, 'name': f'Load Test Courier {courier_id}'}
+
+    def call(self, route, params):
+        payload = {'jsonrpc': '2.0', 'method': 'call', 'params': params}
+        url = self.args.url + ROUTES[route] + (f'?db={self.args.db}' if self.args.db else '')
+        query_count = None
+        started = time.monotonic()
+        try:
+            response = self.session.post(url, data=json.dumps(payload), timeout=self.args.timeout)
+            latency = time.monotonic() - started
+            query_count = response.headers.get('X-Query-Count')
+            outcome = self.classify(route, response)
+        except requests.RequestException:
+            latency = time.monotonic() - started
+            outcome = 'error'
+
+        if started >= self.start_measure:
+            self.stats.add(route, latency, outcome, int(query_count) if query_count else None)
+
+    def classify(self, route, response):
+        if response.status_code != 200:
+            return 'error'
+        body = response.json()
+        if 'error' in body:
+            # Unhandled server error, concurrency errors end up here once Odoo gives up retrying
+            name = (body['error'].get('data') or {}).get('name', '')
+            return 'serialization_failure' if any(error in name for error in SERIALIZATION_ERRORS) else 'error'
+        result = body.get('result') or {}
+        if result.get('error'):
+            return 'error'
+        if route == 'quote':
+            self.pending_calculations.append(result['calculation_id'])
+        return 'ok'
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples, duration):
+    latencies = sorted(latency for latency, _, _ in samples)
+    outcomes = collections.Counter(outcome for _, outcome, _ in samples)
+    query_counts = sorted(count for _, _, count in samples if count is not None)
+    count = len(samples)
+    return {
+        'requests': count,
+        'rps': count / duration if duration else 0,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.50) * 1000 if latencies else None,
+            'p95': percentile(latencies, 0.95) * 1000 if latencies else None,
+            'p99': percentile(latencies, 0.99) * 1000 if latencies else None,
+            'max': latencies[-1] * 1000 if latencies else None,
+        },
+        'errors': outcomes['error'],
+        'error_rate': outcomes['error'] / count if count else 0,
+        'serialization_failures': outcomes['serialization_failure'],
+        'serialization_failure_rate': outcomes['serialization_failure'] / count if count else 0,
+        'queries': {
+            'mean': statistics.mean(query_counts) if query_counts else None,
+            'p95': percentile(query_counts, 0.95),
+        },
+    }
+
+
+def build_report(args, weights, stats, duration):
+    all_samples = [sample for samples in stats.samples.values() for sample in samples]
+    return {
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'url': args.url,
+            'clients': args.clients,
+            'duration': args.duration,
+            'mix': weights,
+        },
+        'total': summarize(all_samples, duration),
+        'routes': {route: summarize(stats.samples[route], duration) for route in weights},
+    }
+
+
+def print_report(report, previous=None):
+    print(f"{'route':<10}{'requests':>10}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'errors':>10}{'serial.':>10}{'queries':>10}{'rps chg':>10}{'p95 chg':>10}")
+    rows = list(report['routes'].items()) + [('total', report['total'])]
+    for name, route in rows:
+        before = (previous['routes'].get(name) if name != 'total' else previous['total']) if previous else None
+        rps_change = p95_change = ''
+        if before and before['rps']:
+            rps_change = f"{route['rps'] / before['rps'] - 1:+.1%}"
+        if before and before['latency_ms']['p95'] and route['latency_ms']['p95']:
+            p95_change = f"{route['latency_ms']['p95'] / before['latency_ms']['p95'] - 1:+.1%}"
+        latency = route['latency_ms']
+        print(f"{name:<10}{route['requests']:>10}{route['rps']:>10.1f}"
+              f"{latency['p50'] or 0:>10.1f}{latency['p95'] or 0:>10.1f}{latency['p99'] or 0:>10.1f}"
+              f"{route['error_rate']:>10.2%}{route['serialization_failure_rate']:>10.2%}"
+              f"{route['queries']['mean'] or 0:>10.1f}{rps_change:>10}{p95_change:>10}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args()
+    weights = parse_mix(args.mix)
+    if not 0 < args.id_base <= MAX_EXTERNAL_ID:
+        raise SystemExit(f"--id-base must be between 1 and {MAX_EXTERNAL_ID}")
+    Client.order_ids = itertools.count(args.id_base)
+    Client.courier_ids = itertools.count(args.id_base)
+    seeds = random.Random(args.seed)
+
+    stats = Stats()
+    start_measure = time.monotonic() + args.warmup
+    stop_at = start_measure + args.duration
+    clients = [Client(args, weights, stats, start_measure, stop_at, seeds.random()) for _ in range(args.clients)]
+
+    _logger.info(f"Running {args.clients} clients for {args.warmup}s warmup + {args.duration}s against {args.url}, "
+                 f"new external ids from {args.id_base}")
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    report = build_report(args, weights, stats, args.duration)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+    print_report(report, previous)
+
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+"""Helpers to run scripts against an Odoo database outside of the HTTP server"""
+from contextlib import contextmanager
+
+
+@contextmanager
+def odoo_environment(database, config=None):
+    """Yield a superuser environment on ``database``, the transaction is committed on exit"""
+    import odoo
+    from odoo import api, SUPERUSER_ID
+
+    args = ['-d', database]
+    if config:
+        args = ['-c', config] + args
+    odoo.tools.config.parse_config(args)
+
+    registry = odoo.modules.registry.Registry(database)
+    with registry.cursor() as cr:
+        yield api.Environment(cr, SUPERUSER_ID, {})
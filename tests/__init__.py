@@ -0,0 +1,5 @@
+from . import test_order_buffer
+from . import test_settlement_pipeline
+from . import test_reconciliation
+from . import test_spatial_index
+from . import test_idempotency
@@ -0,0 +1,39 @@
+from unittest.mock import patch
+
+from odoo.tests import BaseCase, tagged
+
+from ..models.idempotency import TTLCache
+
+
+@tagged('post_install', '-at_install')
+class TestTTLCache(BaseCase):
+
+    def test_hit_and_miss(self):
+        cache = TTLCache(10)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 1, ttl=60)
+        self.assertEqual(cache.get('a'), 1)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(2)
+        cache.put('a', 1, ttl=60)
+        cache.put('b', 2, ttl=60)
+        cache.get('a')
+        cache.put('c', 3, ttl=60)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expiry(self):
+        cache = TTLCache(10)
+        with patch('time.monotonic', return_value=1000.0):
+            cache.put('a', 1, ttl=60)
+        with patch('time.monotonic', return_value=1059.0):
+            self.assertEqual(cache.get('a'), 1)
+        with patch('time.monotonic', return_value=1060.0):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+        self.assertEqual(cache.stats()['size'], 0)
@@ -0,0 +1,85 @@
+from datetime import datetime
+from unittest.mock import patch
+
+from odoo.tests import BaseCase, tagged
+
+from ..models import order_buffer
+from ..models.order_buffer import OrderBuffer
+
+
+def order(order_id, courier_id, restaurant_id, order_total=10.0, delivery_fee=2.0, courier_share=1.5, **extra):
+    return dict({
+        'order_id': order_id,
+        'courier_id': courier_id,
+        'restaurant_id': restaurant_id,
+        'created_at': datetime(2025, 1, 6, 12, 0),
+        'order_total': order_total,
+        'delivery_fee': delivery_fee,
+        'courier_share': courier_share,
+        'calculation_id': None,
+    }, **extra)
+
+
+@tagged('post_install', '-at_install')
+class TestOrderBuffer(BaseCase):
+
+    ORDERS = [
+        order(1, 7, 100, order_total=20.0),
+        order(2, 8, 100, courier_share=2.5),
+        order(3, 7, 101, delivery_fee=3.0, calculation_id=42),
+        order(4, None, 101, order_total=5.0),
+        order(5, 8, None),
+    ]
+
+    def _check_grouping(self):
+        buffer = OrderBuffer.from_rows(self.ORDERS)
+        self.assertEqual(len(buffer), 5)
+
+        couriers = buffer.group('courier_id', ('courier_share', 'order_count'))
+        self.assertEqual(sorted(couriers), [7, 8])
+        orders, sums = couriers[7]
+        self.assertEqual([row['order_id'] for row in orders], [1, 3])
+        self.assertEqual(sums, {'courier_share': 3.0, 'order_count': 2.0})
+        self.assertEqual(couriers[8][1]['courier_share'], 4.0)
+
+        restaurants = buffer.group('restaurant_id', ('order_total', 'delivery_fee'))
+        self.assertEqual(sorted(restaurants), [100, 101])
+        orders, sums = restaurants[101]
+        self.assertEqual([row['order_id'] for row in orders], [3, 4])
+        self.assertEqual(sums, {'order_total': 15.0, 'delivery_fee': 5.0})
+
+    def test_group_numpy(self):
+        if order_buffer.np is None:
+            self.skipTest('NumPy is not installed')
+        self._check_grouping()
+
+    def test_group_python(self):
+        with patch.object(order_buffer, 'np', None):
+            self._check_grouping()
+
+    def test_row_round_trip(self):
+        row = next(iter(OrderBuffer.from_rows(self.ORDERS).group('courier_id', ())[7][0]))
+        self.assertEqual(row['created_at'], datetime(2025, 1, 6, 12, 0))
+        self.assertEqual(row['order_total'], 20.0)
+        self.assertEqual(row['calculation_id'], 0)
+
+    def test_aggregated_rows(self):
+        rows = [
+            {'courier_id': 7, 'restaurant_id': 100, 'order_count': 3,
+             'order_total': 30, 'delivery_fee': 6, 'courier_share': 4.5},
+            {'courier_id': 7, 'restaurant_id': 101, 'order_count': 2,
+             'order_total': 20, 'delivery_fee': 4, 'courier_share': 3},
+        ]
+        for np in (order_buffer.np, None):
+            with patch.object(order_buffer, 'np', np):
+                couriers = OrderBuffer.from_rows(rows).group('courier_id', ('courier_share', 'order_count'))
+                self.assertEqual(couriers[7][1], {'courier_share': 7.5, 'order_count': 5.0})
+
+    def test_missing_partners_only(self):
+        buffer = OrderBuffer.from_rows([order(1, None, None)])
+        for np in (order_buffer.np, None):
+            with patch.object(order_buffer, 'np', np):
+                self.assertEqual(buffer.group('courier_id', ('courier_share',)), {})
+
+    def test_empty(self):
+        self.assertEqual(OrderBuffer().group('courier_id', ('courier_share',)), {})
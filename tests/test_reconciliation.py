@@ -0,0 +1,25 @@
+from odoo.tests import BaseCase, tagged
+
+from ..models.reconciliation import merge_join
+
+
+@tagged('post_install', '-at_install')
+class TestMergeJoin(BaseCase):
+
+    def test_merge_join(self):
+        orders = [{'id': 1}, {'id': 2}, {'id': 4}]
+        calculations = [{'id': 2}, {'id': 3}, {'id': 4}]
+        lines = [{'id': 4}, {'id': 5}]
+        joined = [(key, [row and row['id'] for row in rows])
+                  for key, rows in merge_join(lambda row: row['id'], orders, calculations, lines)]
+        self.assertEqual(joined, [
+            (1, [1, None, None]),
+            (2, [2, 2, None]),
+            (3, [None, 3, None]),
+            (4, [4, 4, 4]),
+            (5, [None, None, 5]),
+        ])
+
+    def test_empty_streams(self):
+        self.assertEqual(list(merge_join(lambda row: row, [], [])), [])
+        self.assertEqual(list(merge_join(lambda row: row, [1], [])), [(1, [1, None])])
@@ -0,0 +1,76 @@
+from odoo.tests import BaseCase, tagged
+
+from ..models.settlement_pipeline import OrderChunkPrefetcher
+
+
+class FakeCursor:
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def execute(self, query, params):
+        pass
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, name=None, cursor_factory=None):
+        return FakeCursor(self.rows)
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def getconn(self):
+        return FakeConnection(self.rows)
+
+    def putconn(self, conn, close=False):
+        pass
+
+
+@tagged('post_install', '-at_install')
+class TestOrderChunkPrefetcher(BaseCase):
+
+    def _chunks(self, courier_ids, chunk_size):
+        rows = [{'order_id': index, 'courier_id': courier_id} for index, courier_id in enumerate(courier_ids)]
+        prefetcher = OrderChunkPrefetcher(FakePool(rows), 'SELECT', (), 'courier_id', chunk_size, queue_size=2)
+        prefetcher.start()
+        chunks = []
+        while True:
+            chunk = prefetcher.queue.get(timeout=5)
+            if chunk is prefetcher.DONE:
+                break
+            chunks.append(chunk)
+        prefetcher.join(timeout=5)
+        return [[row['courier_id'] for row in chunk] for chunk in chunks]
+
+    def test_partners_never_span_chunks(self):
+        courier_ids = [1, 1, 1, 2, 2, 3, 4, 4, 4, 4, 5]
+        chunks = self._chunks(courier_ids, chunk_size=3)
+        self.assertEqual([courier_id for chunk in chunks for courier_id in chunk], courier_ids)
+        seen = set()
+        for chunk in chunks:
+            self.assertFalse(seen & set(chunk))
+            seen |= set(chunk)
+
+    def test_partner_larger_than_chunk(self):
+        self.assertEqual(self._chunks([1, 1, 1, 1, 1, 2], chunk_size=2), [[1, 1, 1, 1, 1], [2]])
+
+    def test_no_rows(self):
+        self.assertEqual(self._chunks([], chunk_size=3), [])
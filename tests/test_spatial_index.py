@@ -0,0 +1,52 @@
+import random
+from unittest.mock import patch
+
+from odoo.tests import BaseCase, tagged
+
+from ..models import spatial_index
+from ..models.spatial_index import GridIndex, haversine_km
+
+
+@tagged('post_install', '-at_install')
+class TestSpatialIndex(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        generator = random.Random(7)
+        self.points = [
+            (partner_id, 1000 + partner_id, f'Restaurant {partner_id}',
+             33.3 + generator.uniform(-0.3, 0.3), 44.4 + generator.uniform(-0.3, 0.3))
+            for partner_id in range(1, 2001)
+        ]
+
+    def _brute_force(self, lat, lng):
+        distances = haversine_km(lat, lng, [p[3] for p in self.points], [p[4] for p in self.points])
+        return sorted((float(distance), point[0]) for distance, point in zip(distances, self.points))
+
+    def _for_each_path(self):
+        """Indexes queried with NumPy, when installed, and with the pure Python fallback"""
+        for np in ([spatial_index.np] if spatial_index.np is not None else []) + [None]:
+            with patch.object(spatial_index, 'np', np):
+                yield GridIndex(self.points)
+
+    def test_haversine(self):
+        # Paris to London
+        distance = float(haversine_km(48.8566, 2.3522, [51.5074], [-0.1278])[0])
+        self.assertAlmostEqual(distance, 343.5, delta=1)
+        self.assertAlmostEqual(float(haversine_km(10, 10, [10], [10])[0]), 0.0)
+
+    def test_within_matches_brute_force(self):
+        expected = [partner_id for distance, partner_id in self._brute_force(33.35, 44.42) if distance <= 5]
+        for index in self._for_each_path():
+            matches = index.within(33.35, 44.42, 5)
+            self.assertEqual([match['partner_id'] for match in matches], expected)
+            self.assertEqual(len(index.within(33.35, 44.42, 5, limit=3)), min(3, len(expected)))
+
+    def test_nearest_matches_brute_force(self):
+        expected = [partner_id for _distance, partner_id in self._brute_force(33.2, 44.5)[:10]]
+        for index in self._for_each_path():
+            self.assertEqual([match['partner_id'] for match in index.nearest(33.2, 44.5, 10)], expected)
+
+    def test_nearest_stops_at_max_radius(self):
+        for index in self._for_each_path():
+            self.assertEqual(index.nearest(0.0, 0.0, 5, max_radius_km=10), [])